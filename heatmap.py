@@ -1,13 +1,17 @@
-import random
+import sys
+
 import numpy as np
 
-from opdyn.Categories import fuzzy_cat
+from opdyn.Cache import ResultCache
 from opdyn.Model import Model
 import opdyn.Helpers as Helpers
+import opdyn.Render as Render
 
-random.seed(1234)
+seed = 1234
 
-def main() -> None:
+def main(store=False) -> None:
+    # store: record the trajectory on disk (Store.TrajectoryStore, kept in the result cache
+    # entry of the run) instead of memory
     learning_rate = 0.5
     dis_percent = 0.25
     online_percent = 0.25
@@ -15,59 +19,45 @@ def main() -> None:
     leader_weight = 0.1
     conf_range = (0.1, 0.3)
     tol_range = (0.1, 0.3)
-    n = Model(10000, learn=learning_rate, dis_percent=dis_percent,
-                leader_weight=leader_weight, conf_l=conf_range[0], conf_h=conf_range[1],
-                tol_l=tol_range[0], tol_h=tol_range[1],
-                onlinePercent=online_percent, leaderPercent=leader_percent, grid_size=20, distrib="Beta")
-    vis1 = [[0 for x in range(n.popl.grid_size)] for y in range(n.popl.grid_size)]
-    for row in range(len(vis1)):
-        for col in range(len(vis1[0])):
-            vis1[row][col] = round(fuzzy_cat["opinion"][n.popl.grid.get((row, col)).getOpCat(n.popl.grid.get((row, col)).getOpinion())], 2)
-
-    vis = [[0 for x in range(n.popl.grid_size)] for y in range(n.popl.grid_size)]
-    for row in range(len(vis)):
-        for col in range(len(vis[0])):
-            vis[row][col] = round(n.popl.grid.get((row, col)).getOpinion(), 2)
+    config = dict(timeSteps=10000, learn=learning_rate, dis_percent=dis_percent,
+                  leader_weight=leader_weight, conf_l=conf_range[0], conf_h=conf_range[1],
+                  tol_l=tol_range[0], tol_h=tol_range[1],
+                  onlinePercent=online_percent, leaderPercent=leader_percent, grid_size=20, distrib="Beta")
+    n = Model(**config, rng=np.random.default_rng(seed))
+    grid_size = n.popl.grid_size
+    vis1 = np.round(Render.category_values(n.popl.opinion), 2).reshape(grid_size, grid_size)
     print(np.matrix(vis1))
     Helpers.plotHeatMap(vis1, "Initial Configuration")
 
-    initial_op_ls = []
-    for i in vis1:
-        initial_op_ls.extend(i)
+    initial_op_ls = vis1.ravel().tolist()
     Helpers.plot_finalOpinions_dist(initial_op_ls)
 
-    n.simulate()
+    if store:
+        # the trajectory plot decodes its frames from the store on disk
+        config["store"] = True
+    # the simulated model comes from the result cache if this run was done before
+    n = ResultCache(".opdyn-cache").simulate(config, seed)
     print("\n\n")
-    for row in range(len(vis)):
-        for col in range(len(vis[0])):
-            vis[row][col] = n.popl.grid.get((row, col)).getOpinion()
-    final_opinions_ls = []
-    for row in range(len(vis)):
-        final_opinions_ls.extend(vis[row])
+    final_opinions_ls = np.asarray(n.popl.opinion, dtype=float).tolist()
     n.plot_opinions_over_time(final_opinions_ls)
-    size_population = n.popl.grid_size * n.popl.grid_size
 
-    vis = [[0 for x in range(n.popl.grid_size)] for y in range(n.popl.grid_size)]
-    for row in range(len(vis)):
-        for col in range(len(vis[0])):
-            vis[row][col] = round(n.popl.grid.get((row, col)).getOpinion(), 2)
-    vis1 = [[0 for x in range(n.popl.grid_size)] for y in range(n.popl.grid_size)]
-    for row in range(len(vis1)):
-        for col in range(len(vis1[0])):
-            vis1[row][col] = round(fuzzy_cat["opinion"][n.popl.grid.get((row, col)).getOpCat(n.popl.grid.get((row, col)).getOpinion())], 2)
+    vis1 = np.round(Render.category_values(n.popl.opinion), 2).reshape(grid_size, grid_size)
     print(np.matrix(vis1))
     Helpers.plotHeatMap(vis1, "Final Configuration")
-    flattened_matrix = np.matrix(vis).flatten()
 
     Helpers.plot_finalOpinions_dist(final_opinions_ls)
+    Helpers.plot_hhi_over_time(n.stats.hhi_series(n.t))
+    # every 50th step of the run, 8 x 8 pixels per cell
+    n.export_animation("evolution.gif", stride=50, scale=8)
 
-    hhi = Helpers.metrics(final_opinions_ls, size_population)
+    # statistics maintained during the run by n.stats
+    metrics = n.stats.summary()
     print("#####")
-    print("HHI: ", hhi)
-    print("Standard Deviation: ", round(np.std(flattened_matrix), 4))
-    print("Mean: ", round(np.mean(flattened_matrix), 4))
-    print("Median: ", np.median(vis))
+    print("HHI: ", metrics["hhi"])
+    print("Standard Deviation: ", round(metrics["std"], 4))
+    print("Mean: ", round(metrics["mean"], 4))
+    print("Median: ", metrics["median"])
     print("#####")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main("--store" in sys.argv[1:])
\ No newline at end of file
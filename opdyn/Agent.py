@@ -1,11 +1,57 @@
-import random
-import numpy as np
-from opdyn.Categories import fuzzy_cat
+from opdyn.Categories import fuzzy_cat, gaussian, memberships, defuzzify
+
+class MembershipView:
+    """
+    Dict-like view over one row of a population's fuzzy membership array.
+    Reads and writes go straight to the underlying NumPy storage so that
+    code written against the old per-agent dicts keeps working.
+    """
+
+    def __init__(self, param, row) -> None:
+        self.categories = list(fuzzy_cat[param])
+        self.row = row
+
+    def __getitem__(self, category):
+        return self.row[self.categories.index(category)]
+
+    def __setitem__(self, category, value) -> None:
+        self.row[self.categories.index(category)] = value
+
+    def __iter__(self):
+        return iter(self.categories)
+
+    def __len__(self) -> int:
+        return len(self.categories)
+
+    def keys(self):
+        return list(self.categories)
+
+    def values(self):
+        return [self.row[i] for i in range(len(self.categories))]
+
+    def items(self):
+        return list(zip(self.categories, self.values()))
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+def _field(name, cast, topology=False):
+    # Property reading / writing the agent's slot in a population array
+    # (topology: writing it changes the agent's neighbors)
+    def getter(self):
+        return cast(getattr(self.popl, name)[self.cell])
+    def setter(self, value):
+        getattr(self.popl, name)[self.cell] = value
+        if topology:
+            self.popl.invalidateNeighbors()
+    return property(getter, setter)
 
 class Agent:
     """
-    Agent Class. An Agent is a cell in the 2D lattice (population)
-    with the following parameters:
+    Agent Class. An Agent is a cell in the 2D lattice (population). The agent
+    holds no state of its own: it is a thin view onto the struct-of-arrays
+    storage of its Population, indexed by the flat cell id (row * grid_size + col).
+    Parameters exposed through the view:
     01. opinion: a value between 0 and 1
     02. pos: a 2-tuple containing the x and y coordinates of the agent in the grid
     03. delta: a value between 0 and 1 (distinctiveness factor)
@@ -25,95 +71,94 @@ class Agent:
     17. fuzzy_avg_opinion: fuzzy degrees of membership for avg. opinion of confidence set cells
     18. fuzzy_nsi: fuzzy degrees of membership for nsi coefficient
     """
- 
-    def __init__(self, opinion, pos, delta, grid_size, nsi,
-                 k, tolerance=0.0, dissenter=False, conf=0.5,
-                 is_leader=False, media_influence=False, distantNeighbors=[],
-                 radius=2, onlineAccess=False, accessibility=0.5) -> None:
-        self.opinion = opinion
-        self.posx = pos[0]
-        self.posy = pos[1]
-        self.delta = delta
-        self.grid_size = grid_size
-        self.k = k
-        self.tolerance = tolerance
-        self.dissenter = dissenter
-        self.is_leader = is_leader
-        self.confidence_threshold = conf
-        self.nsi = nsi
-        self.distantNeighbors = distantNeighbors
-        self.connectivity = radius
-        self.accessibility = accessibility
-        self.onlineAccess = onlineAccess
-        self.radius = radius
-        self.fuzzy_opinion = {"Strongly Disagree": 0.0, "Disagree": 0.0,
-                              "Neutral": 0.0, "Agree": 0.0, "Strongly Agree": 0.0}
-        self.fuzzy_avg_opinion = {"Strongly Disagree": 0.0, "Disagree": 0.0,
-                              "Neutral": 0.0, "Agree": 0.0, "Strongly Agree": 0.0}
-        self.fuzzy_nsi = {"Non-conforming" : 0.0, "Slightly non-conforming": 0.0,
-                          "Neutral": 0.0, "Slightly Conforming": 0.0, "Conforming": 0.0}
+
+    opinion = _field("opinion", float)
+    delta = _field("delta", float)
+    k = _field("k", float)
+    tolerance = _field("tolerance", float)
+    confidence_threshold = _field("confidence", float)
+    nsi = _field("nsi", float)
+    dissenter = _field("dissenter", bool)
+    is_leader = _field("leader", bool)
+    onlineAccess = _field("onlineAccess", bool, topology=True)
+    accessibility = _field("accessibility", float)
+    radius = _field("radius", int)
+    connectivity = radius
+
+    def __init__(self, popl, cell) -> None:
+        self.popl = popl
+        self.cell = cell
+        self.grid_size = popl.grid_size
+        self.posx, self.posy = divmod(cell, popl.grid_size)
+
+    @property
+    def distantNeighbors(self) -> list:
+        return [divmod(i, self.grid_size) for i in self.popl.distantNeighbors[self.cell]]
+
+    @distantNeighbors.setter
+    def distantNeighbors(self, neighbors) -> None:
+        self.popl.distantNeighbors[self.cell] = [row * self.grid_size + col for row, col in neighbors]
+
+    @property
+    def fuzzy_opinion(self) -> MembershipView:
+        return MembershipView("opinion", self.popl.fuzzy_opinion[self.cell])
+
+    @fuzzy_opinion.setter
+    def fuzzy_opinion(self, memberships) -> None:
+        self.popl.fuzzy_opinion[self.cell] = [memberships[c] for c in fuzzy_cat["opinion"]]
+
+    @property
+    def fuzzy_avg_opinion(self) -> MembershipView:
+        return MembershipView("avg_opinion", self.popl.fuzzy_avg_opinion[self.cell])
+
+    @fuzzy_avg_opinion.setter
+    def fuzzy_avg_opinion(self, memberships) -> None:
+        self.popl.fuzzy_avg_opinion[self.cell] = [memberships[c] for c in fuzzy_cat["avg_opinion"]]
+
+    @property
+    def fuzzy_nsi(self) -> MembershipView:
+        return MembershipView("nsi_coeff", self.popl.fuzzy_nsi[self.cell])
+
+    @fuzzy_nsi.setter
+    def fuzzy_nsi(self, memberships) -> None:
+        self.popl.fuzzy_nsi[self.cell] = [memberships[c] for c in fuzzy_cat["nsi_coeff"]]
 
     def getNeighbors(self) -> list:
         # Returns Moore neighbors (excluding the cell itself)
-        row, col = self.posx, self.posy
-        neighbors = []
-        for drow in [-1, 0, 1]:
-            for dcol in [-1, 0, 1]:
-                if drow == 0 and dcol == 0:
-                    continue
-                new_row = (row + drow) % self.grid_size
-                new_col = (col + dcol) % self.grid_size
-                neighbors.append((new_row, new_col))
-        return neighbors
+        return [divmod(i, self.grid_size) for i in self.popl.getNeighbors(self.cell)]
 
     def setDistantNeighbors(self):
         # Gets neighbors at only the nth radius from the cell and
         # adds them to the distant neighbor list according to accessibility
-        neighbors = []
-        radius = self.connectivity
-        for dx in range(-radius, radius + 1):
-            for dy in range(-radius, radius + 1):
-                if dx == 0 and dy == 0 or not (0 <= (self.posx + dx) % self.grid_size < self.grid_size
-                                                and 0 <= (self.posy + dy) % self.grid_size):
-                    continue
-                if abs(dx) <= radius and abs(dy) <= radius and (abs(dx) + abs(dy) == radius):
-                    neighbors.append(((self.posx + dx) % self.grid_size, (self.posy + dy) % self.grid_size))
-        self.distantNeighbors = neighbors[:int(self.accessibility * len(neighbors))]
+        self.popl.setDistantNeighbors([self.cell])
 
     def gaussian(self, x, mean, sigma):
         # Gaussian fuzzifier (membership function)
-        return round(np.exp(-0.5 * ((x - mean) / sigma) ** 2), 2)
+        return gaussian(x, mean, sigma)
 
     def fuzzify(self, param, paramValue, sigma=0.1):
         # Assigns degrees of membership to a parameter being fuzzified
-        memberships = {}
-        for category, mean in fuzzy_cat[param].items():
-            memberships[category] = self.gaussian(paramValue, mean, sigma)
-        return memberships
+        return dict(zip(fuzzy_cat[param], memberships(param, paramValue, sigma)))
 
     def fuzzify_opinion(self, sigma=0.1):
         # Fuzzify opinions
-        self.fuzzy_opinion = self.fuzzify("opinion", self.getOpinion(), sigma)
+        self.popl.fuzzy_opinion[self.cell] = memberships("opinion", self.popl.opinion[self.cell], sigma)
 
     def fuzzify_avg_opinion(self, value, sigma=0.1):
         # Fuzzifies avg. opinion of cells in confidence set
-        self.fuzzy_avg_opinion = self.fuzzify("avg_opinion", value, sigma)
-    
+        self.popl.fuzzy_avg_opinion[self.cell] = memberships("avg_opinion", value, sigma)
+
     def fuzzify_nsi(self, value, sigma=0.1):
         # Fuzzifies the NSI coefficient
-        self.fuzzy_nsi = self.fuzzify("nsi_coeff", value, sigma)
+        self.popl.fuzzy_nsi[self.cell] = memberships("nsi_coeff", value, sigma)
 
     def defuzzify_opinion(self):
         # Fuzzy opinion -> Crisp opinion
-        numerator = sum(mean * self.fuzzy_opinion[category] for category, mean in fuzzy_cat["opinion"].items())
-        denominator = sum(self.fuzzy_opinion.values())
-        self.setOpinion((numerator / denominator if denominator != 0 else self.getOpinion()))
+        self.setOpinion(defuzzify("opinion", self.popl.fuzzy_opinion[self.cell], self.getOpinion()))
 
     def defuzzify_nsi(self):
         # Fuzzy NSI coeff. -> Crisp NSI coeff.
-        numerator = sum(mean * self.fuzzy_nsi[category] for category, mean in fuzzy_cat["nsi_coeff"].items())
-        denominator = sum(self.fuzzy_nsi.values())
-        self.setNSI((numerator / denominator if denominator != 0 else self.nsi))
+        self.setNSI(defuzzify("nsi_coeff", self.popl.fuzzy_nsi[self.cell], self.nsi))
 
     def getOpinion(self) -> float:
         return self.opinion
@@ -129,14 +174,14 @@ class Agent:
         # If leadership is removed, change accessibility to a lower value
         if val == True:
             self.is_leader = True
-            self.accessibility = random.random()**2
+            self.accessibility = self.popl.rng.random()**2
             self.accessibility /= (self.accessibility + 1)
         else:
             self.is_leader = False
-            self.accessibility = random.random() ** (1 / 2)
+            self.accessibility = self.popl.rng.random() ** (1 / 2)
     def remLeader(self) -> None:
         self.is_leader = False
-        self.accessibility = random.random() ** (1 / 2)
+        self.accessibility = self.popl.rng.random() ** (1 / 2)
     def setNSI(self, nsi) -> None:
         self.nsi = nsi
     def getNSICat(self):
@@ -158,4 +203,4 @@ class Agent:
     def setTolerance(self, tol) -> None:
         self.tolerance = tol
     def getTolerance(self) -> float:
-        return self.tolerance
\ No newline at end of file
+        return self.tolerance
@@ -0,0 +1,259 @@
+"""
+    Animation export of recorded runs. Frames are decoded one at a time from a
+    recorded trajectory (TrajectoryRecorder or on-disk TrajectoryStore), drawn
+    by overwriting the data of a single image and streamed to the encoder, so
+    memory does not grow with the length of the run. GIFs are written by
+    Pillow frame by frame with one fixed palette; other formats (.mp4, .webm,
+    .mkv, ...) are encoded by an ffmpeg process reading raw frames from a pipe.
+    With several workers, the frames are split into contiguous segments that
+    are rendered and encoded in parallel and then joined without re-encoding.
+"""
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+import numpy as np
+from PIL import GifImagePlugin, Image
+from opdyn.Quantized import decode
+from opdyn.Render import HeatmapRenderer, category_values
+from opdyn.Store import TrajectoryStore
+
+# ffmpeg output options by file extension (other extensions: ffmpeg's defaults)
+CODECS = {
+    ".mp4": ("-c:v", "libx264", "-pix_fmt", "yuv420p"),
+    ".mkv": ("-c:v", "libx264", "-pix_fmt", "yuv420p"),
+    ".mov": ("-c:v", "libx264", "-pix_fmt", "yuv420p"),
+    ".webm": ("-c:v", "libvpx-vp9", "-pix_fmt", "yuv420p"),
+}
+# yuv420p needs even frame sizes
+EVEN = ("-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2")
+
+class GridPainter:
+    """
+    GridPainter Class. Draws every frame as a plain image of the grid, one
+    scale x scale block of pixels per cell (row 0 at the bottom, as in
+    Helpers.plotHeatMap). Frames are palette indices (the opinion codes) written
+    into one preallocated buffer; `palette` holds the color of every code.
+    01. grid_size: number of cells on each side of the grid
+    02. scale: size of a cell in pixels
+    03. categories: color every cell by the value of its opinion category
+    04. cmap: matplotlib colormap, over a fixed [0, 1] scale
+    """
+
+    def __init__(self, grid_size, scale=1, categories=False, cmap="viridis") -> None:
+        self.grid_size = grid_size
+        self.scale = scale
+        values = decode(np.arange(101, dtype=np.uint8))
+        if categories:
+            values = category_values(values)
+        self.palette = matplotlib.colormaps[cmap](values, bytes=True)[:, :3]
+        self.frame = np.empty((grid_size * scale, grid_size * scale), dtype=np.uint8)
+
+    def paint(self, t, codes) -> np.ndarray:
+        # Frame of the codes after step t
+        g, s = self.grid_size, self.scale
+        self.frame.reshape(g, s, g, s)[:] = codes.reshape(g, g)[::-1, None, :, None]
+        return self.frame
+
+class FigurePainter:
+    """
+    FigurePainter Class. Draws every frame as the heat map figure of
+    Render.HeatmapRenderer (axes, colorbar and a title per frame). Only the
+    image data and the title change between frames. Frames are RGB pixels.
+    01. grid_size: number of cells on each side of the grid
+    02. categories: color every cell by the value of its opinion category
+    03. cmap: matplotlib colormap, over a fixed [0, 1] scale
+    04. title: title of every frame, formatted with the time step t
+    05. dpi: resolution of the figure
+    """
+
+    def __init__(self, grid_size, categories=False, cmap="viridis", title="t = {t}", dpi=100) -> None:
+        self.renderer = HeatmapRenderer(grid_size, categories, cmap=cmap, dpi=dpi)
+        self.title = title
+        self.palette = None
+
+    def paint(self, t, codes) -> np.ndarray:
+        self.renderer.render(decode(codes), title=self.title.format(t=t))
+        return self.renderer.pixels()[:, :, :3]
+
+def painter(settings):
+    # Painter of the export settings (figure, grid_size, scale, categories, cmap, title, dpi)
+    if settings["figure"]:
+        return FigurePainter(settings["grid_size"], settings["categories"], settings["cmap"],
+                             settings["title"], settings["dpi"])
+    return GridPainter(settings["grid_size"], settings["scale"], settings["categories"], settings["cmap"])
+
+class GifWriter:
+    """
+    GifWriter Class. Appends frames to a looping GIF as they come. All frames
+    share one global palette: indexed frames are written as they are, RGB
+    frames are mapped to the nearest palette color.
+    01. path: output file
+    02. width, height: frame size in pixels
+    03. fps: frames per second
+    04. palette: (colors, 3) uint8 palette (at most 256 colors)
+    05. complete: write the GIF header and trailer; segments written without
+                  them are concatenated into one GIF by join()
+    """
+
+    def __init__(self, path, width, height, fps, palette, complete=True) -> None:
+        self.size = (width, height)
+        self.duration = 1000 / fps
+        self.palette = np.asarray(palette, dtype=np.uint8).ravel().tolist()
+        self.reference = Image.new("P", (1, 1))
+        self.reference.putpalette(self.palette)
+        self.complete = complete
+        self.file = open(path, "wb")
+        if complete:
+            header, _ = GifImagePlugin.getheader(self.image(np.zeros((height, width), dtype=np.uint8)),
+                                                 info={"loop": 0})
+            self.file.write(b"".join(header))
+
+    def image(self, frame) -> Image.Image:
+        # Palette image of a frame
+        if frame.ndim == 3:
+            return Image.fromarray(np.ascontiguousarray(frame)).quantize(palette=self.reference,
+                                                                          dither=Image.Dither.NONE)
+        image = Image.frombytes("P", self.size, frame.tobytes())
+        image.putpalette(self.palette)
+        return image
+
+    def write(self, frame) -> None:
+        self.file.write(b"".join(GifImagePlugin.getdata(self.image(frame), duration=self.duration)))
+
+    def close(self) -> None:
+        if self.complete:
+            self.file.write(b";")
+        self.file.close()
+
+class FFmpegWriter:
+    """
+    FFmpegWriter Class. Pipes raw RGB frames to an ffmpeg process.
+    01. path: output file; its extension selects the codec (CODECS)
+    02. width, height: frame size in pixels
+    03. fps: frames per second
+    04. palette: colors of indexed frames (None: frames are RGB)
+    """
+
+    def __init__(self, path, width, height, fps, palette=None) -> None:
+        self.palette = palette
+        self.buffer = np.empty((height, width, 3), dtype=np.uint8)
+        options = CODECS.get(os.path.splitext(path)[1].lower(), ())
+        command = ["ffmpeg", "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                   "-s", str(width) + "x" + str(height), "-r", str(fps), "-i", "-", "-an",
+                   *options, *(EVEN if "yuv420p" in options else ()), path]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frame) -> None:
+        if frame.ndim == 2:
+            np.take(self.palette, frame, axis=0, out=self.buffer)
+        else:
+            self.buffer[:] = frame
+        self.process.stdin.write(self.buffer.data)
+
+    def close(self) -> None:
+        self.process.stdin.close()
+        error = self.process.stderr.read()
+        if self.process.wait() != 0:
+            raise RuntimeError("ffmpeg failed: " + error.decode(errors="replace"))
+
+def writer(path, width, height, fps, palette, complete=True):
+    # GifWriter for .gif files, FFmpegWriter otherwise
+    if path.lower().endswith(".gif"):
+        return GifWriter(path, width, height, fps, palette, complete)
+    return FFmpegWriter(path, width, height, fps, palette)
+
+def gif_palette(paint, first) -> np.ndarray:
+    # Palette of a GIF: the painter's own, or an adaptive palette of its first frame
+    if paint.palette is not None:
+        return paint.palette
+    image = Image.fromarray(np.ascontiguousarray(first)).quantize(256)
+    return np.array(image.getpalette(), dtype=np.uint8).reshape(-1, 3)
+
+def open_trajectory(trajectory):
+    # Trajectory view of a recorder / store, or the store in directory `trajectory`
+    return TrajectoryStore.open(trajectory) if isinstance(trajectory, str) else trajectory
+
+def portable(trajectory):
+    # Form of a trajectory sent to worker processes: the directory of an on-disk store
+    # (each worker reads only its own segment), else the in-memory recorder itself
+    if isinstance(trajectory, TrajectoryStore):
+        if trajectory.writable:
+            trajectory.flush()
+        return trajectory.path
+    return trajectory
+
+def segments(times, count) -> list:
+    # Split a range of time steps into at most `count` contiguous (start, stop) ranges
+    bounds = np.linspace(0, len(times), min(count, len(times)) + 1).round().astype(int)
+    return [(times[lo], times[hi - 1] + 1) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+def encode_segment(job) -> str:
+    # Renders frames start, start + stride, ... < stop of a trajectory and encodes them to path
+    trajectory, path, start, stop, stride, settings, fps, palette, complete = job
+    view = open_trajectory(trajectory)
+    paint = painter(settings)
+    output = None
+    for t, codes in view.frame_codes(stride, start, stop):
+        frame = paint.paint(t, codes)
+        if output is None:
+            output = writer(path, frame.shape[1], frame.shape[0], fps, palette, complete)
+        output.write(frame)
+    output.close()
+    return path
+
+def join(parts, path, width, height, fps, palette) -> None:
+    # Concatenate encoded segments into one file without re-encoding
+    if path.lower().endswith(".gif"):
+        output = GifWriter(path, width, height, fps, palette)
+        for part in parts:
+            with open(part, "rb") as file:
+                shutil.copyfileobj(file, output.file)
+        output.close()
+        return
+    listing = os.path.join(os.path.dirname(parts[0]), "segments.txt")
+    with open(listing, "w") as file:
+        file.writelines("file '" + os.path.abspath(part) + "'\n" for part in parts)
+    result = subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-f", "concat", "-safe", "0",
+                             "-i", listing, "-c", "copy", path], capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError("ffmpeg failed: " + result.stderr.decode(errors="replace"))
+
+def export(trajectory, path, stride=1, start=0, stop=None, fps=25, figure=False, scale=1, categories=False,
+           cmap="viridis", title="t = {t}", dpi=100, workers=1) -> str:
+    # Streams the grid after steps start, start + stride, ... < stop (default: all recorded steps)
+    # of a recorded run to a GIF / video at `path`.
+    # trajectory: TrajectoryRecorder, TrajectoryStore or the directory of a store
+    # figure: draw the heat map figure with axes, colorbar and title instead of the bare grid
+    #         (scale x scale pixels per cell)
+    # workers: number of processes encoding segments in parallel (None: all cores); workers
+    #          get an in-memory recorder pickled, but read a store from disk
+    view = open_trajectory(trajectory)
+    stop = view.steps if stop is None else min(stop, view.steps)
+    times = range(start, stop, stride)
+    if len(times) == 0:
+        raise ValueError("no recorded steps in [" + str(start) + ", " + str(stop) + ")")
+    settings = {"figure": figure, "grid_size": math.isqrt(view.size), "scale": scale, "categories": categories,
+                "cmap": cmap, "title": title, "dpi": dpi}
+    paint = painter(settings)
+    first = paint.paint(start, view.codes_at(start))
+    height, width = first.shape[:2]
+    palette = gif_palette(paint, first) if path.lower().endswith(".gif") else paint.palette
+    spans = segments(times, os.cpu_count() if workers is None else max(1, workers))
+    if len(spans) == 1:
+        return encode_segment((view, path, start, stop, stride, settings, fps, palette, True))
+    directory = tempfile.mkdtemp(prefix=".segments-", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        extension = os.path.splitext(path)[1]
+        parts = [os.path.join(directory, "segment_" + str(i).zfill(4) + extension) for i in range(len(spans))]
+        source = portable(trajectory)
+        jobs = [(source, part, lo, hi, stride, settings, fps, palette, False) for part, (lo, hi) in zip(parts, spans)]
+        with ProcessPoolExecutor(max_workers=len(spans)) as pool:
+            list(pool.map(encode_segment, jobs))
+        join(parts, path, width, height, fps, palette)
+    finally:
+        shutil.rmtree(directory)
+    return path
@@ -0,0 +1,168 @@
+"""
+    On-disk cache of simulation results. An entry is addressed by a hash of
+    everything that determines a run: the full Model configuration, the seed
+    (and stream) of its random generator, the simulate() options and the
+    version of the opdyn code. It holds the summary metrics of the final state
+    (small JSON file, enough for sweep tables) and the simulated Model itself
+    (pickle: final population, statistics and, if recorded, the trajectory; a
+    run configured with a store records its trajectory to a
+    Store.TrajectoryStore in a directory of the entry, which is reopened
+    read-only on load and removed with the entry).
+    The cache is bounded in size; the least recently used entries are evicted.
+"""
+import functools
+import glob
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import numpy as np
+from opdyn.Model import Model
+from opdyn.Sweep import job_rng
+
+@functools.lru_cache(maxsize=None)
+def code_version() -> str:
+    # Hash of the opdyn sources: results of older code are never reused
+    digest = hashlib.sha256()
+    package = os.path.dirname(os.path.abspath(__file__))
+    for path in sorted(glob.glob(os.path.join(package, "*.py"))):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def canonical(value):
+    # JSON-compatible form of key material (NumPy scalars, stopping criteria, ...)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return {"class": type(value).__qualname__, "state": vars(value)}
+
+def rng_of(seed, stream=None) -> np.random.Generator:
+    # Generator of a cached run: default_rng(seed), or stream `stream` spawned from
+    # SeedSequence(seed) (as job `stream` of a Sweep)
+    return np.random.default_rng(seed) if stream is None else job_rng(seed, stream)
+
+class ResultCache:
+    """
+    ResultCache Class. Content-addressed store of simulated Models.
+    01. path: cache directory (created if needed)
+    02. max_bytes: size limit; after every insertion the least recently used
+                   entries are removed until the cache fits
+    Typical use: model = cache.simulate(config, seed) runs
+    Model(**config, rng=np.random.default_rng(seed)).simulate() only the first
+    time and loads the result afterwards. With config["store"] set, the
+    trajectory is stored on disk in the entry (store_path) rather than at
+    config["store"].
+    """
+
+    def __init__(self, path, max_bytes=1 << 30) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, config, seed, stream=None, options=None) -> str:
+        # Hash of a run: configuration, seed / stream, simulate() options and code version
+        material = {"config": config, "seed": seed, "stream": stream, "options": options or {},
+                    "version": code_version()}
+        text = json.dumps(material, sort_keys=True, default=canonical)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def files(self, key) -> tuple:
+        # (summary, model) files of an entry
+        stem = os.path.join(self.path, key[:2], key)
+        return stem + ".json", stem + ".pkl"
+
+    def store_path(self, key) -> str:
+        # Directory of the on-disk trajectory of an entry
+        return os.path.join(self.path, key[:2], key + ".store")
+
+    def touch(self, key) -> None:
+        # Mark an entry as used now (for the LRU eviction)
+        for path in self.files(key):
+            os.utime(path)
+
+    def summary(self, key):
+        # Summary metrics of a cached run, or None
+        path = self.files(key)[0]
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            summary = json.load(file)
+        self.touch(key)
+        return summary
+
+    def load(self, key):
+        # Cached Model of a run, or None (also if the store directory of its trajectory is gone)
+        summary, path = self.files(key)
+        if not os.path.exists(summary):
+            return None
+        try:
+            with open(path, "rb") as file:
+                model = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        self.touch(key)
+        return model
+
+    def put(self, key, model) -> None:
+        # Store a simulated Model; the summary file is written last and marks the entry complete
+        summary, path = self.files(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for target, write in ((path, lambda file: pickle.dump(model, file, pickle.HIGHEST_PROTOCOL)),
+                              (summary, lambda file: file.write(json.dumps(model.stats.summary()).encode()))):
+            temporary = target + ".tmp"
+            try:
+                with open(temporary, "wb") as file:
+                    write(file)
+                os.replace(temporary, target)
+            finally:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+        self.evict(keep=key)
+
+    def entries(self) -> list:
+        # (last use, size, key) of every complete entry
+        entries = []
+        for summary in glob.glob(os.path.join(self.path, "*", "*.json")):
+            key = os.path.basename(summary)[:-len(".json")]
+            size = sum(os.path.getsize(path) for path in self.files(key) if os.path.exists(path))
+            for directory, _, names in os.walk(self.store_path(key)):
+                size += sum(os.path.getsize(os.path.join(directory, name)) for name in names)
+            entries.append((os.path.getmtime(summary), size, key))
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None) -> None:
+        # Remove least recently used entries until the cache fits in max_bytes
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in self.files(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            shutil.rmtree(self.store_path(key), ignore_errors=True)
+            total -= size
+
+    def simulate(self, config, seed, stream=None, **options):
+        # Model(**config, rng=rng_of(seed, stream)) after simulate(**options), from the cache
+        # if this run was done before
+        key = self.key(config, seed, stream, options)
+        model = self.load(key)
+        if model is None:
+            if config.get("store") is not None:
+                # a store left there by an incomplete entry is stale
+                shutil.rmtree(self.store_path(key), ignore_errors=True)
+                config = dict(config, store=self.store_path(key))
+            model = Model(**config, rng=rng_of(seed, stream))
+            model.simulate(**options)
+            self.put(key, model)
+        return model
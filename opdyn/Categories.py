@@ -3,7 +3,11 @@
     1. Opinion - 5 categories
     2. Average opinion of cells in Confidence Set - 5 categories
     3. NSI Coefficient - 5 categories
+    Membership lookup tables for the fuzzy variables are built once per sigma
+    and shared by every agent.
 """
+import functools
+import numpy as np
 
 fuzzy_cat = {
     "opinion" : {
@@ -29,4 +33,46 @@ fuzzy_cat = {
         "Slightly Conforming": 0.75,
         "Conforming": 1.0
     }
-}
\ No newline at end of file
+}
+
+# Opinions (and the parameters drawn alongside them) are kept to two decimals,
+# so a fuzzy variable on [0, 1] only ever sees these 101 distinct inputs
+LEVELS = 101
+
+def gaussian(x, mean, sigma):
+    # Gaussian fuzzifier (membership function)
+    return round(np.exp(-0.5 * ((x - mean) / sigma) ** 2), 2)
+
+@functools.lru_cache(maxsize=None)
+def category_means(param) -> tuple:
+    # Crisp centre of every category of a fuzzy variable, in category order
+    return tuple(fuzzy_cat[param].values())
+
+@functools.lru_cache(maxsize=None)
+def membership_table(param, sigma=0.1) -> np.ndarray:
+    # (101, 5) degrees of membership of every two-decimal value in [0, 1];
+    # row i holds the memberships of i / 100
+    table = np.array([[gaussian(i / 100, mean, sigma) for mean in category_means(param)]
+                      for i in range(LEVELS)])
+    table.flags.writeable = False
+    return table
+
+@functools.lru_cache(maxsize=65536)
+def _memberships_off_grid(param, value, sigma) -> np.ndarray:
+    # Memberships of a value outside the table (e.g. NSI = k * (ideal - opinion))
+    row = np.array([gaussian(value, mean, sigma) for mean in category_means(param)])
+    row.flags.writeable = False
+    return row
+
+def memberships(param, value, sigma=0.1) -> np.ndarray:
+    # Degrees of membership of value for every category of param (read-only)
+    code = round(value * 100)
+    if 0 <= code < LEVELS and code / 100 == value:
+        return membership_table(param, sigma)[code]
+    return _memberships_off_grid(param, float(value), sigma)
+
+def defuzzify(param, degrees, default):
+    # Fuzzy -> crisp (centroid); default is returned when all degrees are zero
+    numerator = sum(mean * degree for mean, degree in zip(category_means(param), degrees))
+    denominator = sum(degrees)
+    return numerator / denominator if denominator != 0 else default
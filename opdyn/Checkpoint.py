@@ -0,0 +1,195 @@
+"""
+    Checkpoints of a running Model. A checkpoint is a single uncompressed .npz
+    file holding the population arrays, the cell selector, the state of the
+    random generators, the time step, the end of the current run, the
+    stopping criteria, the live statistics and the trajectory: for runs
+    recorded in memory the trajectory itself, for runs recorded to a
+    Store.TrajectoryStore its manifest at that step and the events not yet
+    written to a chunk. Model.resume(path) continues the run exactly as if it
+    had never been interrupted (a store is reopened and truncated back to the
+    checkpoint).
+    Parts of the state that only grow during a run (trajectory, HHI history)
+    are captured as views and converted by the writer, so taking a checkpoint
+    does not get slower as the run goes on.
+"""
+import copy
+import json
+import os
+import pickle
+import threading
+import time
+import numpy as np
+from opdyn.Population import AgentGrid, Population
+from opdyn.Quantized import CentiArray
+from opdyn.Recorder import TrajectoryRecorder
+from opdyn.Store import TrajectoryStore
+
+# Population attributes that are plain parameters
+PARAMETERS = ("Uniform", "Beta", "Random", "grid_size", "size", "learning_rate", "dis_percent",
+              "leader_weight", "conf_l", "conf_h", "tol_l", "tol_h", "onlinePercent", "leaderPercent", "compact")
+# Per-agent arrays of a Population
+ARRAYS = ("opinion", "delta", "k", "tolerance", "confidence", "nsi", "accessibility",
+          "dissenter", "leader", "onlineAccess", "radius", "distant_indptr", "distant_indices",
+          "fuzzy_opinion", "fuzzy_avg_opinion", "fuzzy_nsi")
+
+def to_bytes(value) -> np.ndarray:
+    return np.frombuffer(pickle.dumps(value), dtype=np.uint8)
+
+def from_bytes(array):
+    return pickle.loads(array.tobytes())
+
+def snapshot(model) -> dict:
+    # Copies of everything needed to continue `model` (taken between two steps); entries may
+    # be views or callables of append-only state, completed by write()
+    popl = model.popl
+    selector = model.selector
+    arrays = {}
+    for name in ARRAYS:
+        value = getattr(popl, name)
+        arrays[name] = value.codes.copy() if isinstance(value, CentiArray) else value.copy()
+    arrays["selector_buffer"] = np.array(selector.buffer[selector.pos:], dtype=np.int64)
+    arrays["selector_order"] = selector.order.copy()
+    criteria = pickle.dumps(model.criteria)
+    stats = copy.copy(model.stats)
+    stats.counts = stats.counts.copy()
+    # the HHI history only grows: the writer keeps its first `history` entries
+    history = len(stats.history_t)
+
+    def objects():
+        stats.history_t = stats.history_t[:history]
+        stats.history_hhi = stats.history_hhi[:history]
+        return to_bytes({"criteria": pickle.loads(criteria), "stats": stats})
+
+    arrays["objects"] = objects
+    recorder = None
+    if isinstance(model.recorder, (TrajectoryRecorder, TrajectoryStore)):
+        recorder, state = model.recorder.state()
+        recorder["kind"] = "store" if isinstance(model.recorder, TrajectoryStore) else "memory"
+        for name, value in state.items():
+            arrays["recorder_" + name] = value
+    meta = {
+        "population": {name: getattr(popl, name) for name in PARAMETERS},
+        "model": {"timeSteps": model.timeSteps, "t": model.t, "end": model.end, "fixed_nsi": model.fixed_nsi,
+                  "record": model.record, "keyframe_interval": model.keyframe_interval,
+                  "synchronous": model.synchronous},
+        "selector": {"mode": selector.mode, "chunk": selector.chunk,
+                     "rng": selector.rng.bit_generator.state},
+        # state of the population's generator, unless it is the selector's
+        "rng": None if popl.rng is selector.rng else popl.rng.bit_generator.state,
+        "recorder": recorder,
+    }
+    # parameters may be NumPy scalars (e.g. taken from np.linspace)
+    text = json.dumps(meta, default=lambda value: value.item())
+    arrays["meta"] = np.frombuffer(text.encode(), dtype=np.uint8)
+    return arrays
+
+def write(path, arrays) -> None:
+    # Write a snapshot atomically: a crash while writing leaves the previous checkpoint intact
+    arrays = {name: value() if callable(value) else value for name, value in arrays.items()}
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(temporary, path)
+
+def save(model, path) -> None:
+    # Checkpoint `model` to `path` now
+    write(path, snapshot(model))
+
+def generator(state) -> np.random.Generator:
+    # Generator restored from the state of its bit generator
+    rng = np.random.Generator(getattr(np.random, state["bit_generator"])())
+    rng.bit_generator.state = state
+    return rng
+
+def load(path):
+    # Model continuing from the checkpoint at `path`
+    from opdyn.Model import Model
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    meta = json.loads(arrays["meta"].tobytes().decode())
+    popl = Population.__new__(Population)
+    for name, value in meta["population"].items():
+        setattr(popl, name, value)
+    for name in ARRAYS:
+        setattr(popl, name, arrays[name])
+    if popl.compact:
+        for name in ("opinion", "delta", "k", "tolerance", "confidence"):
+            codes = arrays[name]
+            setattr(popl, name, CentiArray.__new__(CentiArray))
+            getattr(popl, name).codes = codes
+    popl.indptr = None
+    popl.indices = None
+    popl.grid = AgentGrid(popl)
+
+    settings = meta["model"]
+    rng = generator(meta["selector"]["rng"])
+    popl.rng = rng if meta["rng"] is None else generator(meta["rng"])
+    model = Model.from_population(popl, settings["timeSteps"], selection=meta["selector"]["mode"],
+                                  record=settings["record"], keyframe_interval=settings["keyframe_interval"],
+                                  nsi=settings["fixed_nsi"], synchronous=settings["synchronous"], rng=rng)
+    recorder = meta["recorder"]
+    if recorder is not None:
+        state = {name[len("recorder_"):]: value for name, value in arrays.items() if name.startswith("recorder_")}
+        if recorder["kind"] == "store":
+            model.store = recorder["path"]
+            model.recorder = TrajectoryStore.resume(recorder, state)
+        else:
+            model.recorder = TrajectoryRecorder.restore(recorder, state)
+    model.t = settings["t"]
+    selector = model.selector
+    selector.chunk = meta["selector"]["chunk"]
+    selector.buffer = arrays["selector_buffer"].tolist()
+    selector.pos = 0
+    selector.order = arrays["selector_order"]
+    objects = from_bytes(arrays["objects"])
+    model.stats = objects["stats"]
+    # the interrupted simulate() call continues with its criteria up to its last step
+    model.resumed = {"criteria": objects["criteria"], "end": settings["end"]}
+    return model
+
+class Checkpointer:
+    """
+    Checkpointer Class. Passed to Model.simulate, writes a checkpoint every
+    `steps` time steps and / or every `seconds` seconds. The state is copied
+    between two steps and written to disk by a background thread while the
+    run goes on; at most one write is in flight.
+    01. path: checkpoint file (.npz), replaced by every new checkpoint
+    02. steps: checkpoint interval in time steps (None: no step interval)
+    03. seconds: checkpoint interval in seconds (None: no time interval)
+    """
+
+    def __init__(self, path, steps=None, seconds=None) -> None:
+        self.path = path
+        self.steps = steps
+        self.seconds = seconds
+        self.last_t = None
+        self.last_time = None
+        self.thread = None
+
+    def start(self, t) -> None:
+        # Count both intervals from now, with the model at step t (called by Model.simulate)
+        self.last_t = t
+        self.last_time = time.monotonic()
+
+    def due(self, t) -> bool:
+        # Whether a checkpoint should be taken now that the model is at step t
+        if self.last_t is None:
+            self.start(t)
+        if self.steps is not None and t - self.last_t >= self.steps:
+            return True
+        return self.seconds is not None and time.monotonic() - self.last_time >= self.seconds
+
+    def save(self, model) -> None:
+        # Snapshot the model and write it in the background
+        arrays = snapshot(model)
+        self.wait()
+        self.thread = threading.Thread(target=write, args=(self.path, arrays))
+        self.thread.start()
+        self.last_t = model.t
+        self.last_time = time.monotonic()
+
+    def wait(self) -> None:
+        # Block until the checkpoint being written (if any) is on disk
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
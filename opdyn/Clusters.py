@@ -0,0 +1,238 @@
+"""
+    Spatial opinion clusters: connected regions of the toroidal grid whose
+    agents fall into the same opinion category (the closest of the
+    fuzzy_cat["opinion"] values, as Agent.getOpCat), with Moore (8-)
+    connectivity.
+"""
+import numpy as np
+from opdyn.Categories import LEVELS, fuzzy_cat
+from opdyn.Quantized import codes_of, level
+
+def category_table() -> np.ndarray:
+    # (101,) opinion category index of every opinion code (ties go to the lower category)
+    values = list(fuzzy_cat["opinion"].values())
+    return np.array([min(range(len(values)), key=lambda i: abs(values[i] - code / 100))
+                     for code in range(LEVELS)], dtype=np.int8)
+
+# Moore offsets in the order of Population.moore()
+OFFSETS = [(drow, dcol) for drow in [-1, 0, 1] for dcol in [-1, 0, 1] if drow != 0 or dcol != 0]
+
+def ring_components() -> np.ndarray:
+    # (256,) number of 8-connected groups formed by a subset (bitmask over OFFSETS) of
+    # the Moore neighbors of a cell, using only links between the neighbors themselves
+    components = np.zeros(256, dtype=np.int8)
+    for mask in range(256):
+        cells = [OFFSETS[i] for i in range(8) if mask >> i & 1]
+        seen = set()
+        for cell in cells:
+            if cell in seen:
+                continue
+            components[mask] += 1
+            stack = [cell]
+            seen.add(cell)
+            while stack:
+                row, col = stack.pop()
+                for other in cells:
+                    if other not in seen and max(abs(other[0] - row), abs(other[1] - col)) == 1:
+                        seen.add(other)
+                        stack.append(other)
+    return components
+
+def label(category, moore) -> np.ndarray:
+    # Vectorized labelling of the connected same-category regions: every cell gets the
+    # smallest cell id of its region (root hooking plus pointer jumping)
+    n = len(category)
+    # every undirected Moore link once (the last 4 offsets mirror the first 4)
+    u = np.tile(np.arange(n), 4)
+    v = moore[:, 4:].T.ravel()
+    keep = category[u] == category[v]
+    u, v = u[keep], v[keep]
+    parent = np.arange(n)
+    while len(u):
+        ru, rv = parent[u], parent[v]
+        active = ru != rv
+        u, v, ru, rv = u[active], v[active], ru[active], rv[active]
+        if not len(u):
+            break
+        np.minimum.at(parent, np.maximum(ru, rv), np.minimum(ru, rv))
+        while True:
+            grand = parent[parent]
+            if (grand == parent).all():
+                break
+            parent = grand
+    return parent
+
+class SpatialClusters:
+    """
+    SpatialClusters Class. Tracks the spatial opinion clusters of a population
+    during Model.simulate (pass it as `observe`). Cells that change category
+    are handled incrementally with a union-find structure: joining a region is
+    a union with the same-category neighbors, leaving one only shrinks it
+    unless the cell's same-category neighbors are not connected among
+    themselves, in which case the region may have split and the labels are
+    recomputed (vectorized) the next time they are needed. The grid is not
+    rescanned per step.
+    01. interval: number of steps between two entries of the history
+    history holds (t, number of clusters, size of the largest cluster) every
+    `interval` steps.
+    """
+
+    categories = category_table()
+    components = ring_components()
+    bits = 1 << np.arange(8)
+
+    def __init__(self, interval=1000) -> None:
+        self.interval = interval
+        self.history = []
+
+    def start(self, popl, t) -> None:
+        self.size = popl.size
+        self.moore = popl.moore()
+        self.category = self.categories[codes_of(popl.opinion)]
+        # a split can only be recognized locally if the 8 neighbors are distinct cells
+        self.local = popl.grid_size >= 3
+        self.relabel()
+
+    def relabel(self) -> None:
+        # Rebuild the union-find structure from the current categories
+        roots = label(self.category, self.moore)
+        counts = np.bincount(roots, minlength=self.size)
+        # union-find over nodes; cell c is node node[c], nodes of cells that changed
+        # category stay behind as links of their old region
+        self.node = np.arange(self.size)
+        self.parent = roots.copy()
+        self.members = counts.copy()
+        self.nodes = self.size
+        # number of clusters per cluster size, for the largest cluster
+        self.by_size = np.bincount(counts[counts > 0], minlength=self.size + 1)
+        self.count = int((counts > 0).sum())
+        self.top = int(counts.max())
+        self.dirty = False
+
+    def find(self, x) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def resize(self, root, change) -> None:
+        # Changes the number of members of a cluster by `change`
+        before = self.members[root]
+        after = before + change
+        self.members[root] = after
+        if before:
+            self.by_size[before] -= 1
+        if after:
+            self.by_size[after] += 1
+        self.count += int(after > 0) - int(before > 0)
+        if after > self.top:
+            self.top = after
+        while self.top and not self.by_size[self.top]:
+            self.top -= 1
+
+    def compact(self) -> None:
+        # Drop the nodes left behind by cells that changed category: every cell becomes its
+        # own node again, linked to one cell of its cluster that holds the cluster's size
+        parent = self.parent[:self.nodes]
+        while True:
+            grand = parent[parent]
+            if (grand == parent).all():
+                break
+            parent = grand
+        roots, first, inverse = np.unique(parent[self.node], return_index=True, return_inverse=True)
+        members = self.members[roots]
+        self.parent[:self.size] = first[inverse]
+        self.members[:] = 0
+        self.members[first] = members
+        self.node = np.arange(self.size)
+        self.nodes = self.size
+
+    def new_node(self) -> int:
+        # Fresh union-find node (storage grows by doubling up to 2 * size nodes, then the
+        # nodes are compacted, so memory does not grow with the length of the run)
+        if self.nodes == len(self.parent):
+            if self.nodes >= 2 * self.size:
+                self.compact()
+            else:
+                self.parent = np.concatenate([self.parent, np.zeros(len(self.parent), dtype=self.parent.dtype)])
+                self.members = np.concatenate([self.members, np.zeros(len(self.members), dtype=self.members.dtype)])
+        x = self.nodes
+        self.parent[x] = x
+        self.members[x] = 0
+        self.nodes += 1
+        return x
+
+    def move(self, cell, category) -> None:
+        # Moves one cell into another opinion category
+        old = self.category[cell]
+        self.category[cell] = category
+        if self.dirty:
+            return
+        neighbors = self.moore[cell]
+        same = self.category[neighbors] == old
+        if not self.local or self.components[int(self.bits[same].sum())] > 1:
+            # the old cluster may have split
+            self.dirty = True
+            return
+        self.resize(self.find(self.node[cell]), -1)
+        x = self.new_node()
+        self.node[cell] = x
+        self.resize(x, 1)
+        for v in neighbors[self.category[neighbors] == category].tolist():
+            a, b = self.find(x), self.find(self.node[v])
+            if a != b:
+                # grow b first so that the largest size never has to be searched for
+                self.resize(b, self.members[a])
+                self.resize(a, -self.members[a])
+                self.parent[a] = b
+
+    def update(self, t, cell, old, new) -> None:
+        if old != new:
+            category = self.categories[level(new)]
+            if category != self.category[cell]:
+                self.move(cell, category)
+        if (t + 1) % self.interval == 0:
+            self.log(t)
+
+    def update_many(self, t, cells, old, new) -> None:
+        # Several cells changed at once (synchronous step): relabel lazily
+        category = self.categories[codes_of(new)]
+        if (category != self.category[cells]).any():
+            self.category[cells] = category
+            self.dirty = True
+        if (t + 1) % self.interval == 0:
+            self.log(t)
+
+    def log(self, t) -> None:
+        self.history.append((t, self.clusters(), self.largest()))
+
+    def clusters(self) -> int:
+        # Number of spatial clusters
+        if self.dirty:
+            self.relabel()
+        return self.count
+
+    def largest(self) -> int:
+        # Number of agents in the largest spatial cluster
+        if self.dirty:
+            self.relabel()
+        return self.top
+
+    def labels(self) -> np.ndarray:
+        # (N,) cluster label (0 ... clusters - 1) of every cell
+        if self.dirty:
+            self.relabel()
+        parent = self.parent[:self.nodes]
+        while True:
+            grand = parent[parent]
+            if (grand == parent).all():
+                break
+            parent = grand
+        self.parent[:self.nodes] = parent
+        return np.unique(parent[self.node], return_inverse=True)[1]
+
+    def sizes(self) -> np.ndarray:
+        # Sizes of all spatial clusters, largest first
+        return np.sort(np.bincount(self.labels()))[::-1]
@@ -0,0 +1,122 @@
+"""
+    Stopping criteria for Model.simulate. Every criterion is set up once from
+    the population (start) and then maintained incrementally from the single
+    cell that changes per step (update), so checking it costs O(1) per step
+    instead of a scan of the whole grid. Synchronous runs, where many cells
+    change in one step, report the whole step at once (update_many). Both
+    return True once the criterion is met.
+"""
+import numpy as np
+from opdyn.Categories import LEVELS
+from opdyn.Quantized import codes_of, encode, level
+from opdyn.Statistics import OpinionStats
+
+class Consensus:
+    """
+    Met when every opinion lies within epsilon of value. Without a value, met
+    when all opinions lie within epsilon of each other (epsilon=0: everyone
+    shares one opinion).
+    01. value: target opinion, or None for any common opinion
+    02. epsilon: allowed distance, in opinion units
+    """
+
+    def __init__(self, value=None, epsilon=0.0) -> None:
+        self.value = value
+        self.epsilon = epsilon
+
+    def start(self, popl, t) -> None:
+        self.counts = np.bincount(codes_of(popl.opinion), minlength=LEVELS)
+        self.width = int(round(self.epsilon * 100))
+        if self.value is not None:
+            centre = level(self.value)
+            self.low, self.high = centre - self.width, centre + self.width
+            self.outside = int(self.counts.sum() - self.counts[max(self.low, 0):self.high + 1].sum())
+
+    def update(self, t, cell, old, new) -> bool:
+        if old != new:
+            old, new = level(old), level(new)
+            self.counts[old] -= 1
+            self.counts[new] += 1
+            if self.value is not None:
+                self.outside += (not self.low <= new <= self.high) - (not self.low <= old <= self.high)
+        return self.met()
+
+    def update_many(self, t, cells, old, new) -> bool:
+        changed = old != new
+        old, new = encode(old[changed]).astype(np.int64), encode(new[changed]).astype(np.int64)
+        np.subtract.at(self.counts, old, 1)
+        np.add.at(self.counts, new, 1)
+        if self.value is not None:
+            self.outside += int(((new < self.low) | (new > self.high)).sum()
+                                - ((old < self.low) | (old > self.high)).sum())
+        return self.met()
+
+    def met(self) -> bool:
+        # Whether the current opinion counts meet the criterion
+        if self.value is not None:
+            return self.outside == 0
+        # spread of the occupied bins; at most 101 bins are inspected
+        occupied = np.flatnonzero(self.counts)
+        return occupied[-1] - occupied[0] <= self.width
+
+class Stagnation:
+    """
+    Met when no opinion has changed during the last `steps` steps.
+    01. steps: length K of the quiet window
+    """
+
+    def __init__(self, steps) -> None:
+        self.steps = steps
+
+    def start(self, popl, t) -> None:
+        self.last_change = t - 1
+
+    def update(self, t, cell, old, new) -> bool:
+        if old != new:
+            self.last_change = t
+        return t - self.last_change >= self.steps
+
+    def update_many(self, t, cells, old, new) -> bool:
+        if (old != new).any():
+            self.last_change = t
+        return t - self.last_change >= self.steps
+
+class StableHHI:
+    """
+    Met when the HHI has stayed within `tolerance` of its value at the start of
+    the window for `window` steps. The HHI is kept up to date by an OpinionStats.
+    01. window: number of steps the HHI has to stay stable
+    02. tolerance: allowed deviation of the HHI within the window
+    """
+
+    def __init__(self, window, tolerance=0.0) -> None:
+        self.window = window
+        self.tolerance = tolerance
+
+    def start(self, popl, t) -> None:
+        self.stats = OpinionStats()
+        self.stats.start(popl, t)
+        self.reference = self.stats.hhi()
+        self.since = t - 1
+
+    def hhi(self) -> float:
+        return self.stats.hhi()
+
+    def update(self, t, cell, old, new) -> bool:
+        if old != new:
+            self.stats.update(t, cell, old, new)
+            self.check(t)
+        return t - self.since >= self.window
+
+    def update_many(self, t, cells, old, new) -> bool:
+        # The HHI is compared once, after all changes of step t
+        if (old != new).any():
+            self.stats.update_many(t, cells, old, new)
+            self.check(t)
+        return t - self.since >= self.window
+
+    def check(self, t) -> None:
+        # Restart the window if the HHI moved away from its reference
+        if abs(self.hhi() - self.reference) > self.tolerance:
+            self.reference = self.hhi()
+            self.since = t
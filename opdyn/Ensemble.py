@@ -0,0 +1,117 @@
+import numpy as np
+from opdyn import Kernels
+from opdyn.Categories import LEVELS
+from opdyn.Model import Model
+
+class Ensemble:
+    """
+    Ensemble Class. Runs independent replicas of one Model configuration in
+    lockstep. The populations of all replicas are stacked into (R, N) arrays and
+    each time step advances every replica by one asynchronous update with a
+    single call of the vectorized kernel.
+    01. config: dict of Model keyword arguments (timeSteps, learn, dis_percent, ...;
+                compact populations are not supported)
+    02. replicas: number of replicas R
+    03. seeds: one seed (int or numpy.random.SeedSequence) per replica (default
+               0, 1, ..., R - 1). Replica r evolves exactly like
+               `Model(**config, rng=np.random.default_rng(seeds[r])).simulate()`
+    The replicas' Populations stay usable: their arrays are views into the stack.
+    """
+
+    fields = ("opinion", "delta", "k", "tolerance", "confidence", "nsi", "accessibility",
+              "dissenter", "leader", "onlineAccess", "radius",
+              "fuzzy_opinion", "fuzzy_avg_opinion", "fuzzy_nsi")
+
+    def __init__(self, config, replicas=1, seeds=None) -> None:
+        if config.get("compact"):
+            # the stacked arrays and the kernel work on float opinions, not on codes
+            raise ValueError("Ensemble does not support compact populations")
+        self.config = dict(config, record=False)
+        self.seeds = list(range(replicas)) if seeds is None else list(seeds)
+        self.replicas = len(self.seeds)
+        # every replica draws from its own, independent stream
+        self.models = [Model(**self.config, rng=np.random.default_rng(seed)) for seed in self.seeds]
+        self.populations = [model.popl for model in self.models]
+        self.size = self.populations[0].size
+        self.learning_rate = self.populations[0].learning_rate
+        self.leader_weight = self.populations[0].leader_weight
+        self.fixed_nsi = self.models[0].fixed_nsi
+        self.timeSteps = self.models[0].timeSteps
+        self.t = 0
+        self.stack()
+
+    def stack(self) -> None:
+        # Move the replicas' arrays into (R, N) stacks; self.<field> is the flat (R * N) view
+        for name in self.fields:
+            stacked = np.stack([getattr(popl, name) for popl in self.populations])
+            for r, popl in enumerate(self.populations):
+                setattr(popl, name, stacked[r])
+            setattr(self, name, stacked.reshape((-1,) + stacked.shape[2:]))
+        # neighbor tables in flat ids of the stack, padded to a common width
+        tables = [popl.neighborTable() for popl in self.populations]
+        width = max(table.shape[1] for table, _ in tables)
+        self.neighbors = np.repeat(np.arange(self.replicas * self.size)[:, None], width, axis=1)
+        self.degree = np.zeros(self.replicas * self.size, dtype=np.int64)
+        for r, (table, degree) in enumerate(tables):
+            rows = slice(r * self.size, (r + 1) * self.size)
+            self.neighbors[rows, :table.shape[1]] = table + r * self.size
+            self.degree[rows] = degree
+
+    @property
+    def opinions(self) -> np.ndarray:
+        # (R, N) opinions of all replicas
+        return self.opinion.reshape(self.replicas, self.size)
+
+    def histogram(self) -> np.ndarray:
+        # (R, 101) number of agents per opinion level in every replica
+        codes = np.rint(self.opinions * 100).astype(np.intp)
+        offsets = np.arange(self.replicas)[:, None] * LEVELS
+        return np.bincount((codes + offsets).ravel(), minlength=self.replicas * LEVELS).reshape(self.replicas, LEVELS)
+
+    def run(self, timeSteps=None, chunk=1024, stop=True) -> dict:
+        # Advances every replica by timeSteps updates (default: the configured timeSteps).
+        # A replica has converged at the first step after which all its agents share one
+        # opinion; with stop=True the run ends as soon as every replica has converged.
+        # Returns per-replica convergence steps (-1: not converged) and final-state metrics
+        timeSteps = self.timeSteps if timeSteps is None else timeSteps
+        rows = np.arange(self.replicas)
+        offsets = rows * self.size
+        counts = self.histogram()
+        convergence = np.where(counts.max(axis=1) == self.size, self.t - 1, -1)
+        end = self.t + timeSteps
+        while self.t < end and not (stop and (convergence >= 0).all()):
+            n = min(chunk, end - self.t)
+            picks = np.stack([model.selector.take(n) for model in self.models], axis=1) + offsets
+            used = 0
+            for cells in picks:
+                used += 1
+                old, new = Kernels.step(self, cells)
+                new_codes = np.rint(new * 100).astype(np.intp)
+                counts[rows, np.rint(old * 100).astype(np.intp)] -= 1
+                counts[rows, new_codes] += 1
+                done = (convergence < 0) & (counts[rows, new_codes] == self.size)
+                convergence[done] = self.t
+                self.t += 1
+                if stop and (convergence >= 0).all():
+                    break
+            if used < n:
+                # hand the unused picks back: a later run continues each replica's sequence
+                for r, model in enumerate(self.models):
+                    model.selector.unread(picks[used:, r] - offsets[r])
+        for model in self.models:
+            model.t = self.t
+            model.get_agent_opinions()
+        return self.metrics(convergence, counts)
+
+    def metrics(self, convergence, counts) -> dict:
+        # Per-replica convergence step, HHI, mean, standard deviation and median
+        shares = np.where(counts > 1, counts / self.size, 0.0)
+        return {
+            "seed": np.array(self.seeds),
+            "convergence": convergence,
+            "steps": self.t,
+            "hhi": np.round((shares ** 2).sum(axis=1), 3),
+            "mean": self.opinions.mean(axis=1),
+            "std": self.opinions.std(axis=1),
+            "median": np.median(self.opinions, axis=1),
+        }
@@ -14,6 +14,15 @@ def plotHeatMap(vis, title) -> None:
     plt.colorbar()
     plt.show()
 
+def plot_hhi_over_time(hhi) -> None:
+    # Plots the HHI after every time step (e.g. Model.stats.hhi_series())
+    plt.clf()
+    plt.plot(np.arange(len(hhi)), hhi)
+    plt.xlabel("Time Steps")
+    plt.ylabel("HHI")
+    plt.title("HHI vs. Time")
+    plt.show()
+
 def plot_finalOpinions_dist(final_opinions_ls):
     # Displays a bar chart of final Opinions over fuzzy categories 
 
@@ -54,4 +63,4 @@ def metrics(final_opinions_ls, population_size):
 def print_metrics(final_opinions_ls, population_size):
     # Prints HHI
     hhi = metrics(final_opinions_ls, population_size)
-    print("HHI" + "     ===>  ", hhi)
\ No newline at end of file
+    print("HHI" + "     ===>  ", hhi)
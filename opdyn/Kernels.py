@@ -0,0 +1,164 @@
+"""
+    Vectorized transition kernel. Applies the local rule of Model.update to a
+    batch of cells at once with whole-array NumPy operations. The arithmetic
+    follows Model.update operation for operation, so a batch of cells whose
+    neighborhoods do not overlap ends up in exactly the same state as updating
+    the cells one after another.
+
+    `state` is any object exposing the flat per-cell arrays of a Population
+    (opinion, delta, k, tolerance, confidence, nsi, leader, dissenter,
+    fuzzy_opinion, fuzzy_nsi), the padded neighbor table `neighbors` / `degree`
+    (see Population.neighborTable, derived from the CSR neighbor index), the scalars learning_rate and leader_weight
+    and optionally fixed_nsi (a constant NSI coefficient, as Model(nsi=...), or an
+    array with one per cell).
+"""
+import numpy as np
+from opdyn.Categories import category_means, membership_table
+from opdyn.Quantized import codes_of
+
+class PopulationState:
+    """
+    Kernel state of a single Population: its arrays are used in place, the
+    neighbor table is built from the population's neighbor index.
+    01. popl: Population
+    02. fixed_nsi: constant NSI coefficient or None (as Model.fixed_nsi)
+    """
+
+    def __init__(self, popl, fixed_nsi=None) -> None:
+        self.popl = popl
+        self.fixed_nsi = fixed_nsi
+        self.neighbors, self.degree = popl.neighborTable()
+
+    def __getattr__(self, name):
+        return getattr(self.popl, name)
+
+def clip(value):
+    # Vectorized Model.roundToRange
+    return np.clip(value, 0.0, 1.0)
+
+def gaussian(x, param, sigma=0.1):
+    # (B, 5) degrees of membership of every value of x (Categories.gaussian per category)
+    means = np.array(category_means(param))
+    return np.round(np.exp(-0.5 * ((x[:, None] - means) / sigma) ** 2), 2)
+
+def defuzzify(param, degrees, default):
+    # Vectorized Categories.defuzzify over the rows of degrees
+    numerator = np.zeros(len(degrees))
+    denominator = np.zeros(len(degrees))
+    for j, mean in enumerate(category_means(param)):
+        numerator = numerator + mean * degrees[:, j]
+        denominator = denominator + degrees[:, j]
+    crisp = np.divide(numerator, denominator, out=np.zeros(len(degrees)), where=denominator != 0)
+    return np.where(denominator != 0, crisp, default)
+
+def nsi_stage(fuzzy_opinion, ideal, k, combine, fixed_nsi=None):
+    # Adds (or subtracts) the fuzzified NSI coefficient to every opinion category;
+    # returns the updated degrees and the last NSI coefficient
+    fuzzy_opinion = fuzzy_opinion.copy()
+    for j in range(fuzzy_opinion.shape[1]):
+        if fixed_nsi is None:
+            nsi = k * np.round(ideal - fuzzy_opinion[:, j], 2)
+        else:
+            nsi = np.full(len(fuzzy_opinion), fixed_nsi, dtype=float)
+        fuzzy_nsi = gaussian(nsi, "nsi_coeff")
+        for j2 in range(fuzzy_nsi.shape[1]):
+            fuzzy_opinion[:, j] = clip(combine(fuzzy_opinion[:, j], fuzzy_nsi[:, j2]))
+    return fuzzy_opinion, nsi
+
+def evaluate(state, cells):
+    # Next state of every cell in `cells`, read from `state` without modifying it.
+    # Returns a dict with the new opinion, nsi, delta, fuzzy_opinion and fuzzy_nsi of the
+    # cells, plus the (neighbor, degrees) pairs the update re-fuzzifies as a side effect
+    cells = np.asarray(cells)
+    opinion = state.opinion
+    own = opinion[cells]
+    neighbors = state.neighbors[cells]
+    valid = np.arange(neighbors.shape[1]) < state.degree[cells][:, None]
+    neighbor_opinion = opinion[neighbors]
+
+    # Confidence set of every cell (based on HK model + tolerance from extended BCM)
+    threshold = state.confidence[cells] - state.tolerance[cells] * 2
+    in_set = valid & (np.abs(neighbor_opinion - own[:, None]) <= threshold[:, None])
+    set_size = in_set.sum(axis=1)
+
+    # Average fuzzy opinion of the confidence set, summed in neighbor order
+    # (neighbors outside the set read an all-zero row appended to the table)
+    table = membership_table("opinion")
+    codes = codes_of(opinion, neighbors)
+    padded = np.vstack([table, np.zeros((1, table.shape[1]))])
+    masked = np.where(in_set, codes, len(table)).T.copy()
+    total = np.zeros((len(cells), table.shape[1]))
+    for j in range(neighbors.shape[1]):
+        total += padded.take(masked[j], axis=0)
+    has_set = set_size > 0
+    average = total / np.maximum(set_size, 1)[:, None]
+    fuzzy_opinion = np.where(has_set[:, None], average, state.fuzzy_opinion[cells])
+
+    # Ideal opinion from the first four (Moore) neighbors
+    first = neighbor_opinion[:, :4]
+    total_op = ((first[:, 0] + first[:, 1]) + first[:, 2]) + first[:, 3]
+    mean = total_op / 4
+    squared = (first - mean[:, None]) ** 2
+    variance = (((squared[:, 0] + squared[:, 1]) + squared[:, 2]) + squared[:, 3]) / 4
+    ideal = np.round(np.round(mean, 2) + state.delta[cells] * np.round(np.sqrt(variance), 2), 2)
+
+    # Case 1: leaders; Case 2 / 3: dissenters subtract, others add the NSI
+    k = state.k[cells]
+    w = state.leader_weight
+    leader = state.leader[cells]
+    fixed_nsi = getattr(state, "fixed_nsi", None)
+    if np.ndim(fixed_nsi):
+        fixed_nsi = np.asarray(fixed_nsi)[cells]
+    led, _ = nsi_stage(fuzzy_opinion, ideal, k, lambda x, fn: (x * (1 - w) + x * w) + fn, fixed_nsi)
+    fuzzy_opinion = np.where(leader[:, None], led, fuzzy_opinion)
+    sign = np.where(state.dissenter[cells], -1.0, 1.0)
+    fuzzy_opinion, nsi = nsi_stage(fuzzy_opinion, ideal, k, lambda x, fn: x + sign * fn, fixed_nsi)
+    fuzzy_nsi = gaussian(nsi, "nsi_coeff")
+
+    # Distinctiveness factor from the first four neighbors
+    delta = state.delta[cells]
+    neighbor_delta = state.delta[neighbors[:, :4]]
+    avg_delta = (((neighbor_delta[:, 0] + neighbor_delta[:, 1]) + neighbor_delta[:, 2]) + neighbor_delta[:, 3]) / 4
+    new_delta = np.trunc(np.clip(delta + state.learning_rate * (avg_delta - delta), -5, 5))
+
+    return {
+        "opinion": np.round(defuzzify("opinion", fuzzy_opinion, own), 2),
+        "nsi": defuzzify("nsi_coeff", fuzzy_nsi, nsi),
+        "delta": new_delta,
+        "fuzzy_opinion": fuzzy_opinion,
+        "fuzzy_nsi": fuzzy_nsi,
+        "refuzzified": neighbors[in_set],
+        "refuzzified_degrees": table[codes[in_set]],
+    }
+
+def apply(state, cells, result, refuzzify=True) -> None:
+    # Write an evaluate() result into `state` (refuzzify=False skips the side effect
+    # on the fuzzy opinions of the neighbors)
+    if refuzzify:
+        state.fuzzy_opinion[result["refuzzified"]] = result["refuzzified_degrees"]
+    state.fuzzy_opinion[cells] = result["fuzzy_opinion"]
+    state.fuzzy_nsi[cells] = result["fuzzy_nsi"]
+    state.opinion[cells] = result["opinion"]
+    state.nsi[cells] = result["nsi"]
+    state.delta[cells] = result["delta"]
+
+def step(state, cells) -> tuple:
+    # Asynchronous update of a batch of cells with non-overlapping neighborhoods;
+    # returns the opinions of the cells before and after the update
+    cells = np.asarray(cells)
+    old = state.opinion[cells]
+    result = evaluate(state, cells)
+    apply(state, cells, result)
+    return old, result["opinion"]
+
+def synchronous_step(state) -> tuple:
+    # Synchronous update of every cell: all new values are computed from the previous
+    # state into separate buffers and only then written back. The re-fuzzification of
+    # neighbors' fuzzy opinions is skipped: within a synchronous step every cell
+    # re-fuzzifies its own neighbors, so the side effect has no well-defined order.
+    # Returns the opinions of all cells before and after the step
+    cells = np.arange(len(state.opinion))
+    old = state.opinion.copy()
+    result = evaluate(state, cells)
+    apply(state, cells, result, refuzzify=False)
+    return old, result["opinion"]
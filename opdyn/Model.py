@@ -1,19 +1,28 @@
-import random
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import numpy as np
-from opdyn.Categories import fuzzy_cat
+from opdyn import Checkpoint, Kernels, Rules
+from opdyn.Categories import fuzzy_cat, membership_table, memberships, defuzzify
 from opdyn.Population import Population
+from opdyn.Quantized import codes_of
+from opdyn.Recorder import TrajectoryRecorder
+from opdyn.Scheduler import CellSelector, independent_groups
+from opdyn.Statistics import OpinionStats
+from opdyn.Store import TrajectoryStore
 
 class Model:
     """
     Model Class. This model is based on the HK model, Normative Social Influence,
     online communication through distant neighbors and other novelties through
-    fuzzy cellular automata.   
+    fuzzy cellular automata. All simulation state (population, trajectory, cell
+    selection) is owned by the instance, so several models can coexist in one process.
+    Pass rng (a numpy.random.Generator) to draw the population and the cell selection
+    from it rather than from the global `random` module, e.g. one stream per parallel run.
     """
-    # opinions_over_time : stores opinions per time step for line plot
-    opinions_over_time = {}
     def __init__(self, timeSteps, learn, dis_percent, leader_weight, conf_l, conf_h,
-                 tol_l, tol_h, onlinePercent, leaderPercent, grid_size, distrib) -> None:
+                 tol_l, tol_h, onlinePercent, leaderPercent, grid_size, distrib, selection="uniform",
+                 record=True, keyframe_interval=1000, popl=None, nsi=None, synchronous=False,
+                 compact=False, store=None, rng=None, overwrite=False) -> None:
         if distrib == "Beta":
             self.Beta = True
             self.Uniform = False
@@ -26,33 +35,96 @@ class Model:
             self.Beta = False
             self.Uniform = False
             self.Random = True
-        # initializing the population
-        self.popl = Population(grid_size, self.Uniform, self.Beta, self.Random, learn, dis_percent, leader_weight, conf_l, conf_h,
-                               tol_l, tol_h, onlinePercent, leaderPercent)
+        # initializing the population (unless an already initialized one is given)
+        if popl is None:
+            popl = Population(grid_size, self.Uniform, self.Beta, self.Random, learn, dis_percent, leader_weight, conf_l, conf_h,
+                              tol_l, tol_h, onlinePercent, leaderPercent, compact, rng)
+        self.popl = popl
+        # constant NSI coefficient for every update (None: computed per agent from k and
+        # its ideal opinion)
+        self.fixed_nsi = nsi
         self.grid_op = None
         self.timeSteps = timeSteps
-        self.grid_opinion_over_time = {t : None for t in range(int(self.timeSteps))}
         self.opinion_of_agents_over_time = None
+        # trajectory of opinions (change events + keyframes), created by simulate()
+        self.record = record
+        self.keyframe_interval = keyframe_interval
+        self.recorder = None
+        # directory to write the trajectory to (Store.TrajectoryStore) instead of memory;
+        # an existing store there is only replaced with overwrite=True
+        self.store = store
+        self.overwrite = overwrite
+        # live histogram / mean / std / HHI of the opinions, created by simulate()
+        self.stats = None
+        # objects notified of every step of the current simulate() call, its stopping
+        # criteria and the step at which it ends
+        self.observers = []
+        self.criteria = []
+        self.end = None
+        # criteria and end of an interrupted simulate() call (set by Model.resume)
+        self.resumed = None
+        self.checkpointer = None
+        # number of time steps simulated so far
+        self.t = 0
+        # order in which cells are picked by the asynchronous update ("uniform" / "sweep")
+        self.selector = CellSelector(self.popl.size, selection, rng=rng)
+        # synchronous mode: every time step updates all cells at once from the previous state
+        self.synchronous = synchronous
+
+    @classmethod
+    def from_population(cls, popl, timeSteps, **kwargs):
+        # Model around an existing population (e.g. a Population.clone()), without re-drawing it
+        distrib = "Beta" if popl.Beta else "Uniform" if popl.Uniform else "Random"
+        return cls(timeSteps, popl.learning_rate, popl.dis_percent, popl.leader_weight, popl.conf_l, popl.conf_h,
+                   popl.tol_l, popl.tol_h, popl.onlinePercent, popl.leaderPercent, popl.grid_size, distrib,
+                   popl=popl, **kwargs)
+
+    @classmethod
+    def resume(cls, path):
+        # Model restored from a checkpoint (see opdyn.Checkpoint); its next simulate() call
+        # continues the interrupted one: same criteria, same last step, same results
+        return Checkpoint.load(path)
+
+    def save_checkpoint(self, path) -> None:
+        # Checkpoint the model now, e.g. to warm-start variations from a common state
+        Checkpoint.save(self, path)
 
     def get_agent_opinions(self):
         # Returns opinions of all agents in the population within self.grid_op
         if self.grid_op is None:
             self.grid_op = np.zeros([self.popl.grid_size,self.popl.grid_size])
-        for pos, _ in np.ndenumerate(self.grid_op):
-            self.grid_op[pos] = self.popl.grid[pos].opinion
-
-    def plot_opinions_over_time(self, final_opinions_ls):
-        # Displays a line plot of Opinion vs. Time
-        time = list(self.grid_opinion_over_time.keys())
-        opinions = [ op.flatten() for op in list(self.grid_opinion_over_time.values())]
-        self.opinion_of_agents_over_time = [[opinions[t][pos] for t in time] for pos in range(len(opinions[0]))]
-        for agent in range(self.popl.grid_size * self.popl.grid_size): plt.plot(time, self.opinion_of_agents_over_time[agent])
+        self.grid_op[:] = self.popl.opinion.reshape(self.popl.grid_size, self.popl.grid_size)
+
+    def plot_opinions_over_time(self, final_opinions_ls=None, stride=None, max_points=2000,
+                                max_agents=None, out=None):
+        # Displays a line plot of Opinion vs. Time; all agents are drawn as a single LineCollection.
+        # stride / max_points downsample in time, max_agents draws a random subset of agents
+        # and out may be a preallocated (e.g. memory-mapped) (T, N) array for the trajectories
+        steps = self.recorder.steps
+        if stride is None:
+            stride = max(1, -(-steps // max_points))
+        agents = np.arange(self.popl.size)
+        if max_agents is not None and max_agents < len(agents):
+            agents = np.sort(np.random.default_rng(0).choice(agents, max_agents, replace=False))
+        time = np.arange(0, steps, stride)
+        self.opinion_of_agents_over_time = self.recorder.to_array(stride, agents, out)
+        segments = np.empty((len(agents), len(time), 2))
+        segments[:, :, 0] = time
+        segments[:, :, 1] = self.opinion_of_agents_over_time.T
+        colors = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+        ax = plt.gca()
+        ax.add_collection(LineCollection(segments, colors=colors, linewidths=0.8))
+        ax.autoscale_view()
         plt.xlabel("Time Steps")
         plt.ylabel("Opinion")
-        plt.legend()
         plt.title("Opinion vs. Time")
         plt.show()
 
+    def export_animation(self, path, **options):
+        # Streams the recorded evolution of the grid to a GIF / video (see opdyn.Animation.export)
+        from opdyn import Animation
+        return Animation.export(self.recorder, path, **options)
+
     def roundToRange(self, value):
         # Workaround to ensure values do not overflow
         if value <= 0:
@@ -62,69 +134,216 @@ class Model:
         else:
             return value
 
-    def update(self) -> None:
+    def update(self) -> tuple:
         # Transition Function / Local Rule
+        # Returns the updated cell with its opinion before and after the update
+        popl = self.popl
 
         # Fully Asynchronous Update (one cell selected at random at once)
-        pos1, cell1 = random.choice(list(self.popl.grid.items()))
-        neighbors = cell1.getNeighbors()
-        # If cell is connected online:
-        if cell1.onlineAccess:
-            neighbors.extend(cell1.distantNeighbors)
+        c = self.selector.next()
+        old = popl.opinion[c]
+        # Moore neighbors, plus distant neighbors if the cell is connected online:
+        neighbors = popl.neighborSlice(c)
 
         # Confidence set of the agent (based on HK model + tolerance from extended BCM)
-        confidence_set = [i for i in neighbors if abs(self.popl.grid[i].getOpinion() - cell1.getOpinion())
-                           <= cell1.confidence_threshold - cell1.getTolerance() * 2]
+        threshold = popl.confidence[c] - popl.tolerance[c] * 2
+        confidence_set = neighbors[np.abs(popl.opinion[neighbors] - popl.opinion[c]) <= threshold]
 
         # Calculation of degrees of membership for the average fuzzy opinion of all agents
         # in the confidence set of the current cell:
-        avg_fuzzy_opinion = {category: 0 for category in fuzzy_cat["opinion"]}
-        if confidence_set:        
-            for i in confidence_set:
-                self.popl.grid[i].fuzzify_opinion()
-                for category in fuzzy_cat["opinion"]:
-                    avg_fuzzy_opinion[category] += self.popl.grid[i].fuzzy_opinion[category]
-            num_neighbors = len(confidence_set)
-            for category in fuzzy_cat["opinion"]:
-                avg_fuzzy_opinion[category] /= num_neighbors
-            cell1.fuzzy_opinion = avg_fuzzy_opinion
-
-        # Case 1: If current agent is a leader:
-        if cell1.is_leader:
-            for category in fuzzy_cat["opinion"]:
-                nsi = cell1.k * round(self.popl.getIdealOpinion(cell1) - cell1.fuzzy_opinion[category], 2)
-                cell1.setNSI(nsi)
-                cell1.fuzzify_nsi(nsi)
-                for cat2 in fuzzy_cat["nsi_coeff"]:
-                    cell1.fuzzy_opinion[category] = self.roundToRange((cell1.fuzzy_opinion[category] * (1 - self.popl.leader_weight) + cell1.fuzzy_opinion[category] * self.popl.leader_weight) + cell1.fuzzy_nsi[cat2])
-
-        # Case 2: If the current cell is a dissenter:
-        if cell1.checkDissenter():
-            for category in fuzzy_cat["opinion"]:
-                # NSI coefficient
-                nsi = cell1.k * round(self.popl.getIdealOpinion(cell1) - cell1.fuzzy_opinion[category], 2)
-                cell1.setNSI(nsi)
-                cell1.fuzzify_nsi(nsi)
-                for cat2 in fuzzy_cat["nsi_coeff"]:
-                    cell1.fuzzy_opinion[category] = self.roundToRange(cell1.fuzzy_opinion[category] - cell1.fuzzy_nsi[cat2])
-
-        # Case 3: If the current cell is not a dissenter:
+        # (memberships are read from the lookup table by opinion in hundredths)
+        if len(confidence_set):
+            codes = codes_of(popl.opinion, confidence_set)
+            popl.fuzzy_opinion[confidence_set] = membership_table("opinion")[codes]
+            avg_fuzzy_opinion = popl.fuzzy_opinion[confidence_set].sum(axis=0)
+            avg_fuzzy_opinion /= len(confidence_set)
+            popl.fuzzy_opinion[c] = avg_fuzzy_opinion
+
+        fuzzy_opinion = popl.fuzzy_opinion[c]
+        fuzzy_nsi = popl.fuzzy_nsi[c]
+        if self.fixed_nsi is not None:
+            # Constant NSI coefficient: the three cases below become one chain of vector
+            # operations over all opinion categories (Rules.CompiledRules, same results)
+            rules = Rules.compiled(popl.leader_weight, self.fixed_nsi)
+            fuzzy_opinion[:] = rules.apply(fuzzy_opinion, popl.leader[c], popl.dissenter[c])
+            fuzzy_nsi[:] = rules.fuzzy_nsi
+            popl.nsi[c] = rules.nsi
         else:
-            for category in fuzzy_cat["opinion"]:
-                nsi = cell1.k * round(self.popl.getIdealOpinion(cell1) - cell1.fuzzy_opinion[category], 2)
-                cell1.setNSI(nsi)
-                cell1.fuzzify_nsi(nsi)
-                for cat2 in fuzzy_cat["nsi_coeff"]:
-                    cell1.fuzzy_opinion[category] = self.roundToRange(cell1.fuzzy_opinion[category] + cell1.fuzzy_nsi[cat2])
+            ideal = popl.getIdealOpinion(c)
+            categories = range(len(fuzzy_cat["opinion"]))
+            nsi_categories = range(len(fuzzy_cat["nsi_coeff"]))
+
+            # Case 1: If current agent is a leader:
+            if popl.leader[c]:
+                for j in categories:
+                    nsi = popl.k[c] * round(ideal - fuzzy_opinion[j], 2)
+                    popl.nsi[c] = nsi
+                    fuzzy_nsi[:] = memberships("nsi_coeff", nsi)
+                    for j2 in nsi_categories:
+                        fuzzy_opinion[j] = self.roundToRange((fuzzy_opinion[j] * (1 - popl.leader_weight) + fuzzy_opinion[j] * popl.leader_weight) + fuzzy_nsi[j2])
+
+            # Case 2: If the current cell is a dissenter:
+            if popl.dissenter[c]:
+                for j in categories:
+                    # NSI coefficient
+                    nsi = popl.k[c] * round(ideal - fuzzy_opinion[j], 2)
+                    popl.nsi[c] = nsi
+                    fuzzy_nsi[:] = memberships("nsi_coeff", nsi)
+                    for j2 in nsi_categories:
+                        fuzzy_opinion[j] = self.roundToRange(fuzzy_opinion[j] - fuzzy_nsi[j2])
+
+            # Case 3: If the current cell is not a dissenter:
+            else:
+                for j in categories:
+                    nsi = popl.k[c] * round(ideal - fuzzy_opinion[j], 2)
+                    popl.nsi[c] = nsi
+                    fuzzy_nsi[:] = memberships("nsi_coeff", nsi)
+                    for j2 in nsi_categories:
+                        fuzzy_opinion[j] = self.roundToRange(fuzzy_opinion[j] + fuzzy_nsi[j2])
 
         # Defuzzification to use opinion and nsi coeff. values for next iteration:
-        cell1.defuzzify_opinion()
-        cell1.defuzzify_nsi()
+        popl.opinion[c] = round(defuzzify("opinion", fuzzy_opinion, popl.opinion[c]), 2)
+        popl.nsi[c] = defuzzify("nsi_coeff", fuzzy_nsi, popl.nsi[c])
         # Update distinctiveness factor of the current cell:
-        cell1.setDelta(self.popl.getNextDelta(cell1))
+        popl.delta[c] = popl.getNextDelta(c)
+        if self.recorder is not None:
+            self.recorder.record(self.t, c, old, popl.opinion[c])
+        return c, old, popl.opinion[c]
+
+    def update_group(self, state, cells, criteria=()):
+        # Applies the updates of a group of cells with disjoint neighborhoods in one kernel
+        # call, as steps self.t, self.t + 1, ... Criteria see the steps one by one; if one
+        # is met, the updates after that step are dropped. Returns the number of steps
+        # taken and the step at which a criterion was met (or None)
+        popl = self.popl
+        old = popl.opinion[cells]
+        result = Kernels.evaluate(state, cells)
+        new = result["opinion"]
+        converged = None
+        for i in range(len(cells)):
+            if any([criterion.update(self.t + i, cells[i], old[i], new[i]) for criterion in criteria]):
+                converged = self.t + i
+                cells = cells[:i + 1]
+                result = Kernels.evaluate(state, cells)
+                break
+        Kernels.apply(state, cells, result)
+        for i in range(len(cells)):
+            for observer in self.observers:
+                observer.update(self.t, cells[i], old[i], new[i])
+            if self.recorder is not None:
+                self.recorder.record(self.t, cells[i], old[i], new[i])
+                self.recorder.advance(self.t)
+            self.t += 1
+        return len(cells), converged
+
+    def simulate(self, stop=None, batch=None, observe=None, checkpoint=None):
+        # Runs timeSteps updates; only the cells that change are recorded.
+        # stop: a stopping criterion or a list of them (see opdyn.Convergence). The run
+        # ends after the first step at which any criterion is met and that step is
+        # returned; None is returned if the run used all timeSteps without converging.
+        # batch: draw this many picks at a time and apply runs of picks with disjoint
+        # neighborhoods as one vectorized update; the result is identical to batch=None.
+        # In synchronous mode every time step is one update of the whole grid.
+        # observe: an observer or a list of them (e.g. Clusters.SpatialClusters), started
+        # like the criteria and notified of every step like self.stats.
+        # checkpoint: a Checkpoint.Checkpointer writing checkpoints during the run
+        criteria = [] if stop is None else list(stop) if isinstance(stop, (list, tuple)) else [stop]
+        observers = [] if observe is None else list(observe) if isinstance(observe, (list, tuple)) else [observe]
+        if self.record and self.recorder is None:
+            if self.store is not None:
+                self.recorder = TrajectoryStore(self.store, self.popl.opinion, self.keyframe_interval,
+                                                overwrite=self.overwrite)
+            else:
+                self.recorder = TrajectoryRecorder(self.popl.opinion, self.keyframe_interval)
+        if self.stats is None:
+            self.stats = OpinionStats()
+            self.stats.start(self.popl, self.t)
+        self.end = self.t + self.timeSteps
+        if self.resumed is not None:
+            # continue the interrupted run (its criteria are already started)
+            if self.resumed["end"] is not None:
+                self.end = self.resumed["end"]
+            if stop is None:
+                criteria = self.resumed["criteria"]
+            else:
+                for criterion in criteria:
+                    criterion.start(self.popl, self.t)
+            self.resumed = None
+        else:
+            for criterion in criteria:
+                criterion.start(self.popl, self.t)
+        self.criteria = criteria
+        self.checkpointer = checkpoint
+        if checkpoint is not None:
+            checkpoint.start(self.t)
+        for observer in observers:
+            observer.start(self.popl, self.t)
+        self.observers = [self.stats] + observers
+        if self.synchronous:
+            converged = self.simulate_synchronous(criteria)
+        elif batch:
+            converged = self.simulate_batched(criteria, batch)
+        else:
+            converged = None
+            while self.t < self.end:
+                cell, old, new = self.update()
+                for observer in self.observers:
+                    observer.update(self.t, cell, old, new)
+                if self.recorder is not None:
+                    self.recorder.advance(self.t)
+                self.t += 1
+                if any([criterion.update(self.t - 1, cell, old, new) for criterion in criteria]):
+                    converged = self.t - 1
+                    break
+                self.step_checkpoint()
+        if checkpoint is not None:
+            checkpoint.wait()
+        self.criteria = []
+        self.end = None
+        self.checkpointer = None
+        if self.recorder is not None:
+            self.recorder.flush()
+        self.get_agent_opinions()
+        return converged
+
+    def simulate_batched(self, criteria, batch):
+        # Asynchronous run applying conflict-free groups of picks with the vectorized kernel
+        state = Kernels.PopulationState(self.popl, self.fixed_nsi)
+        converged = None
+        while self.t < self.end and converged is None:
+            picks = self.selector.take(min(batch, self.end - self.t))
+            done = 0
+            for cells in independent_groups(picks, state.neighbors):
+                steps, converged = self.update_group(state, cells, criteria)
+                done += steps
+                if converged is not None:
+                    break
+            # picks not used because the run stopped early stay with the selector
+            self.selector.unread(picks[done:])
+            if converged is None:
+                self.step_checkpoint()
+        return converged
+
+    def simulate_synchronous(self, criteria):
+        # Synchronous run: each step updates every cell from the previous state
+        # (see Kernels.synchronous_step). Criteria are checked once per step, with all
+        # its changes (update_many)
+        state = Kernels.PopulationState(self.popl, self.fixed_nsi)
+        cells = np.arange(self.popl.size)
+        while self.t < self.end:
+            old, new = Kernels.synchronous_step(state)
+            for observer in self.observers:
+                observer.update_many(self.t, cells, old, new)
+            if self.recorder is not None:
+                self.recorder.record_many(self.t, cells, old, new)
+                self.recorder.advance(self.t)
+            self.t += 1
+            if any([criterion.update_many(self.t - 1, cells, old, new) for criterion in criteria]):
+                return self.t - 1
+            self.step_checkpoint()
+        return None
 
-    def simulate(self) -> None:
-        for t in range(self.timeSteps):
-            self.update()
-            self.get_agent_opinions()
-            self.grid_opinion_over_time[t] = self.grid_op.copy()
\ No newline at end of file
+    def step_checkpoint(self) -> None:
+        # Write a checkpoint between two steps if one is due
+        if self.checkpointer is not None and self.checkpointer.due(self.t):
+            self.checkpointer.save(self)
@@ -1,10 +1,95 @@
+import copy
+import functools
 import random
+import numpy as np
 from opdyn.Agent import Agent
+from opdyn.Quantized import CentiArray, centi
+
+@functools.lru_cache(maxsize=None)
+def ring_offsets(radius) -> np.ndarray:
+    # (4 * radius, 2) (drow, dcol) offsets of the cells at Manhattan distance `radius`,
+    # in the order of Agent.setDistantNeighbors; computed once per radius
+    offsets = np.array([(dx, dy) for dx in range(-radius, radius + 1) for dy in range(-radius, radius + 1)
+                        if abs(dx) + abs(dy) == radius], dtype=np.int64).reshape(-1, 2)
+    offsets.flags.writeable = False
+    return offsets
+
+class DistantNeighbors:
+    """
+    List-like view of the distant neighbors of every cell of a Population:
+    item i is the list of flat ids of the distant neighbors of cell i. The
+    ids are stored in the population's CSR arrays distant_indptr /
+    distant_indices; assigning an item replaces that cell's entries.
+    """
+
+    def __init__(self, popl) -> None:
+        self.popl = popl
+
+    def __getitem__(self, cell) -> list:
+        indptr = self.popl.distant_indptr
+        return self.popl.distant_indices[indptr[cell]:indptr[cell + 1]].tolist()
+
+    def __setitem__(self, cell, neighbors) -> None:
+        neighbors = np.asarray(neighbors, dtype=np.int64)
+        self.popl.replaceDistantNeighbors([cell], np.array([0, len(neighbors)]), neighbors)
+
+    def __len__(self) -> int:
+        return self.popl.size
+
+    def __iter__(self):
+        return (self[i] for i in range(self.popl.size))
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+class AgentGrid:
+    """
+    Read-only mapping of (row, col) -> Agent over a Population. Agents are
+    views onto the population arrays, created on access, so neither building
+    nor iterating the grid copies any state.
+    """
+
+    def __init__(self, popl) -> None:
+        self.popl = popl
+
+    def agent(self, cell) -> Agent:
+        # Agent view of a flat cell id
+        return Agent(self.popl, cell)
+
+    def __getitem__(self, pos) -> Agent:
+        return Agent(self.popl, pos[0] * self.popl.grid_size + pos[1])
+
+    def get(self, pos, default=None):
+        row, col = pos
+        if 0 <= row < self.popl.grid_size and 0 <= col < self.popl.grid_size:
+            return self[pos]
+        return default
+
+    def __contains__(self, pos) -> bool:
+        return self.get(pos) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return self.popl.size
+
+    def keys(self) -> list:
+        return [divmod(i, self.popl.grid_size) for i in range(self.popl.size)]
+
+    def values(self) -> list:
+        return [Agent(self.popl, i) for i in range(self.popl.size)]
+
+    def items(self) -> list:
+        return list(zip(self.keys(), self.values()))
 
 class Population:
     """
     Population Class. A population is a configuration consisting of a 2D grid of
     Agents along with their parameters and values at a particular time step.
+    Agent state is stored as struct-of-arrays: one contiguous NumPy array per
+    parameter, indexed by flat cell id (row * grid_size + col). `grid` exposes
+    the familiar (row, col) -> Agent mapping on top of these arrays.
     Population-level parameters include:
     01. Uniform, Beta, Random: boolean values determining which distribution is
                                used to initialize opinions
@@ -13,20 +98,35 @@ class Population:
     04. dis_percent: % of dissenters within the population
     05. leader_percent: % of leaders within the population
     06. online_percent: % of online connected agents within the population
+        (roles are given to exactly int(percent * N) distinct cells)
     07. leader_weight: a value between 0 and 1 which determines influence of leader
     08. conf_l, conf_h: min. and max. range limits for confidence threshold
     09. tol_l, tol_h: min. and max. range limits for tolerance
+    Per-agent arrays (length grid_size * grid_size):
+    10. opinion, delta, k, tolerance, confidence, nsi, accessibility: float64
+    11. dissenter, leader, onlineAccess: bool
+    12. radius: int (connectivity radius for online neighbors)
+    13. distant_indptr, distant_indices: CSR of the distant (online) neighbors of every
+                                         cell, see distantNeighbors
+    14. fuzzy_opinion, fuzzy_avg_opinion, fuzzy_nsi: (N, 5) degrees of membership
+    15. compact: if True, opinion, k, tolerance and confidence are stored as uint8
+                 hundredths and delta as int16 hundredths (see opdyn.Quantized)
+    Neighbor index (CSR, built once and shared by all agents, see adjacency()):
+    16. indptr, indices: the neighbors of cell i are indices[indptr[i]:indptr[i + 1]],
+                         the 8 Moore neighbors first, then the distant neighbors of
+                         online connected cells
+    17. rng: numpy.random.Generator used for every random draw (initialization, Agent.setLeader)
     """
 
-    grid = {}
     def __init__(self, grid_size=10, Uniform=True,
                  Beta=False, Random=False,
                  learn=0.25, dis_percent=0.01, leader_weight=0.1, conf_l=0.1, conf_h=0.3,
-                 tol_l=0, tol_h=0.15, onlinePercent=0.5, leaderPercent=0.5) -> None:
+                 tol_l=0, tol_h=0.15, onlinePercent=0.5, leaderPercent=0.5, compact=False, rng=None) -> None:
         self.Uniform = Uniform
         self.Beta = Beta
         self.Random = Random
         self.grid_size = grid_size
+        self.size = grid_size * grid_size
         self.learning_rate = learn
         self.dis_percent = dis_percent
         self.leader_weight = leader_weight
@@ -36,139 +136,272 @@ class Population:
         self.tol_h = tol_h
         self.onlinePercent = onlinePercent
         self.leaderPercent = leaderPercent
-        self.createPopulation()
-        self.setDissenters()
-        self.setOnlineAcc()
-        self.setLeaders()
-
-    def createPopulation(self) -> None:
-        # Initialize opinions and parameters of all Agents in the grid
-        for row in range(self.grid_size):
-            for col in range(self.grid_size):
-                self.grid[(row, col)] = Agent(opinion=self.createOpinion(), pos=[row, col],
-                                              delta=self.createRandom(),
-                                              grid_size=self.grid_size,
-                                              nsi=0,
-                                              k=self.createRandom(),
-                                              dissenter=False,
-                                              tolerance=round(random.uniform(self.tol_l, self.tol_h), 2),
-                                              conf=round(random.uniform(self.conf_l, self.conf_h), 2),
-                                              is_leader=False,
-                                              distantNeighbors=[], radius=random.randint(1, 5),
-                                              onlineAccess=False, accessibility=0)
-                self.grid[(row, col)].setLeader(False)
-
-    def setDissenters(self) -> None:
+        self.compact = compact
+        # all random draws of the population (and of its agents) come from this generator;
+        # by default it is seeded from the `random` module, so that `random.seed(...)`
+        # keeps populations reproducible
+        self.rng = rng if rng is not None else np.random.default_rng(random.getrandbits(64))
+        self.allocate()
+        self.createPopulation(self.rng)
+        self.setDissenters(self.rng)
+        self.setOnlineAcc(self.rng)
+        self.setLeaders(self.rng)
+
+    def allocate(self) -> None:
+        # Allocate one contiguous array per agent parameter
+        n = self.size
+        self.opinion = np.zeros(n)
+        self.delta = np.zeros(n)
+        self.k = np.zeros(n)
+        self.tolerance = np.zeros(n)
+        self.confidence = np.zeros(n)
+        self.nsi = np.zeros(n)
+        self.accessibility = np.zeros(n)
+        self.dissenter = np.zeros(n, dtype=bool)
+        self.leader = np.zeros(n, dtype=bool)
+        self.onlineAccess = np.zeros(n, dtype=bool)
+        self.radius = np.zeros(n, dtype=np.int64)
+        self.distant_indptr = np.zeros(n + 1, dtype=np.int64)
+        self.distant_indices = np.zeros(0, dtype=np.int64)
+        self.fuzzy_opinion = np.zeros((n, 5))
+        self.fuzzy_avg_opinion = np.zeros((n, 5))
+        self.fuzzy_nsi = np.zeros((n, 5))
+        self.indptr = None
+        self.indices = None
+        if self.compact:
+            for name in ("opinion", "k", "tolerance", "confidence"):
+                setattr(self, name, CentiArray(getattr(self, name)))
+            self.delta = CentiArray(self.delta, np.int16)
+        self.grid = AgentGrid(self)
+
+    def clone(self):
+        # Independent copy of this population (same state, nothing re-drawn), e.g. to
+        # run several variants of a model from one initialized configuration
+        other = copy.copy(self)
+        for name, value in vars(self).items():
+            if isinstance(value, (np.ndarray, CentiArray)):
+                setattr(other, name, value.copy())
+        other.rng = copy.deepcopy(self.rng)
+        other.grid = AgentGrid(other)
+        return other
+
+    @property
+    def distantNeighbors(self) -> DistantNeighbors:
+        # distantNeighbors[i]: flat ids of the distant neighbors of cell i
+        return DistantNeighbors(self)
+
+    def index(self, cell) -> int:
+        # Flat cell id of an Agent, a (row, col) position or a flat id
+        if isinstance(cell, Agent):
+            return cell.cell
+        if isinstance(cell, tuple):
+            return cell[0] * self.grid_size + cell[1]
+        return cell
+
+    def createPopulation(self, rng) -> None:
+        # Initialize opinions and parameters of all Agents in the grid (one draw per parameter)
+        n = self.size
+        self.opinion[:] = self.createOpinion(rng, n)
+        self.delta[:] = self.createRandom(rng, n)
+        self.k[:] = self.createRandom(rng, n)
+        self.tolerance[:] = centi(rng.uniform(self.tol_l, self.tol_h, n))
+        self.confidence[:] = centi(rng.uniform(self.conf_l, self.conf_h, n))
+        self.radius[:] = rng.integers(1, 6, n)
+        # every agent starts as a follower
+        self.leader[:] = False
+        self.accessibility[:] = rng.random(n) ** (1 / 2)
+
+    def pickCells(self, rng, percent) -> np.ndarray:
+        # Flat ids of exactly int(percent * N) distinct cells
+        return rng.choice(self.size, int(percent * self.grid_size * self.grid_size), replace=False)
+
+    def setDissenters(self, rng) -> None:
         # Set dissenters within the population based on % of dissenters
-        totalDissenters = int(self.dis_percent * self.grid_size * self.grid_size)
-        for i in range(totalDissenters):
-            x = random.randint(0, self.grid_size - 1)
-            y = random.randint(0, self.grid_size - 1)
-            self.grid[(x, y)].setDissenter(True)
-    
-    def setOnlineAcc(self) -> None:
+        self.dissenter[self.pickCells(rng, self.dis_percent)] = True
+
+    def setOnlineAcc(self, rng) -> None:
         # Set online connected cells within the population based on % of online connected cells
-        totalOnline = int(self.onlinePercent * self.grid_size * self.grid_size)
-        for i in range(totalOnline):
-            x = random.randint(0, self.grid_size - 1)
-            y = random.randint(0, self.grid_size - 1)
-            self.grid[(x, y)].onlineAccess = True
-            # online connected agents have distant neighbors
-            self.grid[(x, y)].setDistantNeighbors()
-
-    def setLeaders(self) -> None:
+        cells = self.pickCells(rng, self.onlinePercent)
+        self.onlineAccess[cells] = True
+        # online connected agents have distant neighbors
+        self.setDistantNeighbors(cells)
+
+    def setLeaders(self, rng) -> None:
         # Set leader within the population based on % of leaders
-        totalLeaders = int(self.leaderPercent * self.grid_size * self.grid_size)
-        for i in range(totalLeaders):
-            x = random.randint(0, self.grid_size - 1)
-            y = random.randint(0, self.grid_size - 1)
-            self.grid[(x, y)].setLeader(True)
+        cells = self.pickCells(rng, self.leaderPercent)
+        self.leader[cells] = True
+        # leaders get a lower accessibility
+        accessibility = rng.random(len(cells)) ** 2
+        self.accessibility[cells] = accessibility / (accessibility + 1)
+
+    def setDistantNeighbors(self, cells) -> None:
+        # Agent.setDistantNeighbors for many (distinct) cells in one vectorized pass: the cells
+        # at Manhattan distance `radius` (wrapping around the grid), cut to the agent's accessibility
+        cells = np.asarray(cells, dtype=np.int64)
+        radius = self.radius[cells]
+        top = int(radius.max(initial=0))
+        # (top + 1, 4 * top, 2) ring offsets of every radius, padded
+        table = np.zeros((top + 1, max(4 * top, 1), 2), dtype=np.int64)
+        for r in range(1, top + 1):
+            table[r, :4 * r] = ring_offsets(r)
+        counts = (self.accessibility[cells] * 4 * radius).astype(np.int64)
+        indptr = np.zeros(len(cells) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        owner = np.repeat(np.arange(len(cells)), counts)
+        offsets = table[radius[owner], np.arange(indptr[-1]) - indptr[owner]]
+        rows, cols = np.divmod(cells[owner], self.grid_size)
+        indices = (((rows + offsets[:, 0]) % self.grid_size) * self.grid_size
+                   + (cols + offsets[:, 1]) % self.grid_size)
+        self.replaceDistantNeighbors(cells, indptr, indices)
+
+    def replaceDistantNeighbors(self, cells, indptr, indices) -> None:
+        # Replace the distant neighbors of (distinct) cells by the CSR rows (indptr, indices)
+        cells = np.asarray(cells, dtype=np.int64)
+        degree = np.diff(self.distant_indptr)
+        kept = np.ones(self.size, dtype=bool)
+        kept[cells] = False
+        old_rows = np.repeat(np.arange(self.size), degree)
+        degree[cells] = np.diff(indptr)
+        new_indptr = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(degree, out=new_indptr[1:])
+        new_indices = np.empty(new_indptr[-1], dtype=np.int64)
+        keep = kept[old_rows]
+        rows = old_rows[keep]
+        new_indices[new_indptr[rows] + (np.arange(len(old_rows)) - self.distant_indptr[old_rows])[keep]] = \
+            self.distant_indices[keep]
+        rows = np.repeat(cells, np.diff(indptr))
+        new_indices[new_indptr[rows] + np.arange(indptr[-1]) - np.repeat(indptr[:-1], np.diff(indptr))] = indices
+        self.distant_indptr, self.distant_indices = new_indptr, new_indices
+        self.invalidateNeighbors()
+
+    def moore(self) -> np.ndarray:
+        # (N, 8) flat ids of the Moore neighbors of every cell (toroidal grid)
+        rows, cols = np.divmod(np.arange(self.size), self.grid_size)
+        offsets = [(drow, dcol) for drow in [-1, 0, 1] for dcol in [-1, 0, 1] if drow != 0 or dcol != 0]
+        return np.stack([((rows + drow) % self.grid_size) * self.grid_size + (cols + dcol) % self.grid_size
+                         for drow, dcol in offsets], axis=1)
+
+    def buildNeighbors(self) -> None:
+        # Build the CSR neighbor index: Moore neighbors, then distant neighbors if online
+        moore = self.moore()
+        distant = np.diff(self.distant_indptr) * self.onlineAccess
+        degree = moore.shape[1] + distant
+        indptr = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(degree, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int64)
+        is_moore = np.zeros(indptr[-1], dtype=bool)
+        slots = indptr[:-1, None] + np.arange(moore.shape[1])
+        indices[slots] = moore
+        is_moore[slots] = True
+        indices[~is_moore] = self.distant_indices[np.repeat(self.onlineAccess, np.diff(self.distant_indptr))]
+        self.indptr, self.indices = indptr, indices
+
+    def invalidateNeighbors(self) -> None:
+        # Drop the neighbor index after a change of distant neighbors or online access;
+        # it is rebuilt on next use
+        self.indptr = None
+        self.indices = None
+
+    def adjacency(self) -> tuple:
+        # CSR neighbor index (indptr, indices), built on first use
+        if self.indptr is None:
+            self.buildNeighbors()
+        return self.indptr, self.indices
+
+    def neighborSlice(self, cell) -> np.ndarray:
+        # Flat ids of all neighbors of a cell (a view into the neighbor index)
+        indptr, indices = self.adjacency()
+        i = self.index(cell)
+        return indices[indptr[i]:indptr[i + 1]]
+
+    def getNeighbors(self, cell) -> list:
+        # Flat ids of the Moore neighbors of a cell (excluding the cell itself)
+        return self.neighborSlice(cell)[:8].tolist()
+
+    def getAllNeighbors(self, cell) -> list:
+        # Moore neighbors followed by distant neighbors for online connected cells
+        return self.neighborSlice(cell).tolist()
+
+    def neighborTable(self) -> tuple:
+        # (N, D) flat ids of every cell's neighbors (Moore first, then distant), padded
+        # with the cell's own id, and the (N,) number of valid entries per row
+        indptr, indices = self.adjacency()
+        degree = np.diff(indptr)
+        table = np.repeat(np.arange(self.size)[:, None], degree.max(), axis=1)
+        rows = np.repeat(np.arange(self.size), degree)
+        table[rows, np.arange(len(indices)) - indptr[rows]] = indices
+        return table, degree
 
     def getNextOpinion(self, cell) -> int:
         # Based on conformity, returns next opinion of a cell
-        return round(cell.getOpinion() + cell.k *
-                     (round(self.getIdealOpinion(cell), 2) - cell.getOpinion()), 2)
+        i = self.index(cell)
+        return round(self.opinion[i] + self.k[i] *
+                     (round(self.getIdealOpinion(i), 2) - self.opinion[i]), 2)
 
     def getMeanOpinion(self, cell) -> float:
         # Returns mean opinion of all neighbors (including online)
-        data = []
-        neighbors = cell.getNeighbors()
-        if cell.onlineAccess:
-            neighbors.extend(cell.distantNeighbors)
-        for i in range(4):
-            data.append(self.grid[neighbors[i]].getOpinion())
+        data = list(self.opinion[self.neighborSlice(cell)[:4]])
         if len(data) == 0: return float('nan')
         return round(sum(data) / len(data), 2)
 
     def getSDOpinion(self, cell) -> int:
         # Returns standard deviation of opinions of all neighbors (including online)
-        data = []
-        neighbors = cell.getNeighbors()
-        if cell.onlineAccess:
-            neighbors.extend(cell.distantNeighbors)
-        for i in range(4):
-            data.append(self.grid[neighbors[i]].getOpinion())
+        data = list(self.opinion[self.neighborSlice(cell)[:4]])
         if not data: return None
         mean = sum(data) / len(data)
         squared_deviations = [pow(x - mean, 2) for x in data]
         variance = sum(squared_deviations) / len(data)
-        return round(pow(variance, 0.5), 2)
+        return round(np.sqrt(variance), 2)
 
     def getIdealOpinion(self, cell) -> float:
         # Based on conformity, returns ideal opinion of a cell
-        return round(self.getMeanOpinion(cell) + cell.getDelta() * self.getSDOpinion(cell), 2)
+        return round(self.getMeanOpinion(cell) + self.delta[self.index(cell)] * self.getSDOpinion(cell), 2)
 
     def getAvgDelta(self, cell) -> int:
         # Computes average distinctiveness factor of all neighbors (including distant neighbors)
-        data = []
-        neighbors = cell.getNeighbors()
-        if cell.onlineAccess:
-            neighbors.extend(cell.distantNeighbors)
-        for i in range(4):
-            data.append(self.grid[neighbors[i]].getDelta())
+        data = list(self.delta[self.neighborSlice(cell)[:4]])
         return sum(data) / len(data)
 
     def getNextDelta(self, cell) -> int:
         # Based on NSI, updates delta of a cell to the its next possible value (closer to mean)
-        data = []
-        neighbors = cell.getNeighbors()
-        if cell.onlineAccess:
-            neighbors.extend(cell.distantNeighbors)
-        for i in range(4):
-            data.append(self.grid[neighbors[i]].getDelta())
-        newDelta = min(max(cell.getDelta() +
+        delta = self.delta[self.index(cell)]
+        newDelta = min(max(delta +
                             self.learning_rate *
-                            (self.getAvgDelta(cell) - cell.getDelta()), -5),
+                            (self.getAvgDelta(cell) - delta), -5),
                             5)
         return int(newDelta)
 
-    def createOpinion(self) -> float:
-        # Computes opinion based on distribution used
+    def createOpinion(self, rng, n) -> np.ndarray:
+        # Computes n opinions based on distribution used
         if self.Beta == True:
-            return self.createBetaOpinion()
+            return self.createBetaOpinion(rng, n)
         if self.Uniform == True:
-            return self.createUniformOpinion()
+            return self.createUniformOpinion(rng, n)
         if self.Random == True:
-            return self.createRandomOpinion()
+            return self.createRandomOpinion(rng, n)
 
-    def createBetaOpinion(self, alpha=2, beta=2) -> float:
-        u1, u2 = random.random(), random.random()
-        t1 = pow(u1, 1/(alpha-1))
-        t2 = pow(u2, 1/(beta-1))
+    def createBetaOpinion(self, rng, n, alpha=2, beta=2) -> np.ndarray:
+        u1, u2 = rng.random(n), rng.random(n)
+        t1 = u1 ** (1/(alpha-1))
+        t2 = u2 ** (1/(beta-1))
         sample = (t1 + t2) / (1 + t1 + t2)
-        return round(sample, 2)
-
-    def createUniformOpinion(self, low=0, high=1) -> float:
-        return round(random.uniform(low, high), 2)
-
-    def createRandom(self) -> float:
-        value = random.random()
-        while value <= 0 or value >= 1:
-            value = random.random()
-        return round(value, 2)
-
-    def createRandomOpinion(self, low=0, high=1) -> float:
-        value = random.random() * (high + abs(low)) + low
-        while low > value or value > high:
-            value = random.random() * (high + abs(low)) + low
-        return round(value, 2)
\ No newline at end of file
+        return centi(sample)
+
+    def createUniformOpinion(self, rng, n, low=0, high=1) -> np.ndarray:
+        return centi(rng.uniform(low, high, n))
+
+    def createRandom(self, rng, n) -> np.ndarray:
+        value = rng.random(n)
+        redraw = (value <= 0) | (value >= 1)
+        while redraw.any():
+            value[redraw] = rng.random(redraw.sum())
+            redraw = (value <= 0) | (value >= 1)
+        return centi(value)
+
+    def createRandomOpinion(self, rng, n, low=0, high=1) -> np.ndarray:
+        value = rng.random(n) * (high + abs(low)) + low
+        redraw = (low > value) | (value > high)
+        while redraw.any():
+            value[redraw] = rng.random(redraw.sum()) * (high + abs(low)) + low
+            redraw = (low > value) | (value > high)
+        return centi(value)
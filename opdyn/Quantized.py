@@ -0,0 +1,85 @@
+"""
+    Compact storage for two-decimal values. Opinions (and delta, k, tolerance
+    and confidence) are always rounded to hundredths, so they can be kept as
+    small integer codes (value * 100) instead of float64: uint8 for values in
+    [0, 1], int16 for delta (which moves between -5 and 5). Codes index the
+    membership lookup tables directly.
+"""
+import numpy as np
+
+def encode(values, dtype=np.uint8):
+    # Integer codes (hundredths) of two-decimal values
+    return np.rint(np.asarray(values, dtype=float) * 100).astype(dtype)
+
+def level(value) -> int:
+    # Code of a single two-decimal value (histogram bin of an opinion)
+    return int(round(value * 100))
+
+def decode(codes):
+    # Two-decimal values of integer codes (code / 100 is exactly round(value, 2))
+    return codes / 100
+
+def centi(values) -> np.ndarray:
+    # Values rounded to hundredths (bulk round(value, 2))
+    return decode(np.rint(np.asarray(values, dtype=float) * 100))
+
+def codes_of(values, index=slice(None)):
+    # Codes of values[index] as table indices, read directly from a CentiArray
+    if isinstance(values, CentiArray):
+        return values.codes[index].astype(np.intp)
+    return np.rint(values[index] * 100).astype(np.intp)
+
+class CentiArray(np.lib.mixins.NDArrayOperatorsMixin):
+    """
+    Array of two-decimal values stored as integer hundredths. Indexing returns
+    floats and assignment rounds to hundredths, so it can stand in for a flat
+    float64 Population array; arithmetic and NumPy functions work on the
+    decoded values.
+    01. values: initial values
+    02. dtype: integer type of the codes (uint8: [0, 2.55], int16: [-327.68, 327.67])
+    """
+
+    def __init__(self, values, dtype=np.uint8) -> None:
+        self.codes = encode(values, dtype)
+
+    def __getitem__(self, index):
+        return decode(self.codes[index])
+
+    def __setitem__(self, index, value) -> None:
+        self.codes[index] = encode(value, self.codes.dtype)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __iter__(self):
+        return iter(decode(self.codes))
+
+    def __array__(self, dtype=None, copy=None):
+        values = decode(self.codes)
+        return values if dtype is None else values.astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [np.asarray(x) if isinstance(x, CentiArray) else x for x in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __repr__(self) -> str:
+        return "CentiArray(" + repr(decode(self.codes)) + ")"
+
+    @property
+    def shape(self) -> tuple:
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes
+
+    def copy(self):
+        other = CentiArray.__new__(CentiArray)
+        other.codes = self.codes.copy()
+        return other
+
+    def reshape(self, *shape) -> np.ndarray:
+        return decode(self.codes).reshape(*shape)
+
+    def tolist(self) -> list:
+        return decode(self.codes).tolist()
@@ -0,0 +1,200 @@
+import numpy as np
+from opdyn.Quantized import encode, decode
+
+class TrajectoryView:
+    """
+    Queries over a recorded opinion trajectory, shared by the in-memory
+    TrajectoryRecorder and the on-disk Store.TrajectoryStore. Subclasses
+    provide size, steps, initial (codes), keyframe_t, keyframe(k) (a copy of
+    the codes of keyframe k), event_codes(start, stop) and event_blocks()
+    (all events in time order, block by block).
+    Step t refers to the state after the t-th update, as in Model.simulate.
+    """
+
+    def events(self, start=-1, stop=None) -> tuple:
+        # (t, cell, old, new) arrays of the events with start < t <= stop
+        t, cells, old, new = self.event_codes(start, stop)
+        return t, cells, decode(old), decode(new)
+
+    def apply(self, state, start, stop) -> np.ndarray:
+        # Bring `state` (codes after step start) forward to the codes after step stop
+        _, cells, _, new = self.event_codes(start, stop)
+        if len(cells):
+            # only the last change of every cell within the window matters
+            last_cells, first = np.unique(cells[::-1], return_index=True)
+            state[last_cells] = new[::-1][first]
+        return state
+
+    def codes_at(self, t) -> np.ndarray:
+        # uint8 codes of the opinions after step t (t = -1 gives the initial state)
+        if not -1 <= t < self.steps:
+            raise IndexError("step " + str(t) + " was not recorded")
+        k = np.searchsorted(self.keyframe_t, t, side="right") - 1
+        return self.apply(self.keyframe(k), self.keyframe_t[k], t)
+
+    def grid_at(self, t) -> np.ndarray:
+        # Flat opinions after step t (t = -1 gives the initial state)
+        return decode(self.codes_at(t))
+
+    def agent_series(self, cell) -> np.ndarray:
+        # Opinion of one cell after every recorded step (length = steps)
+        ts, values = [], [self.initial[cell:cell + 1]]
+        for t, cells, _, new in self.event_blocks():
+            mask = cells == cell
+            ts.append(t[mask])
+            values.append(new[mask])
+        values = np.concatenate(values)
+        return decode(values[np.searchsorted(np.concatenate(ts), np.arange(self.steps), side="right")])
+
+    def frame_codes(self, stride=1, start=0, stop=None):
+        # Yields (t, codes) every `stride` steps; the codes array is updated in place
+        stop = self.steps if stop is None else min(stop, self.steps)
+        if start >= stop:
+            return
+        state = self.codes_at(start)
+        previous = start
+        for t in range(start, stop, stride):
+            self.apply(state, previous, t)
+            previous = t
+            yield t, state
+
+    def frames(self, stride=1, start=0, stop=None):
+        # Yields (t, opinions) every `stride` steps, decoding one frame at a time
+        for t, state in self.frame_codes(stride, start, stop):
+            yield t, decode(state)
+
+    def to_array(self, stride=1, cells=None, out=None, start=0, stop=None) -> np.ndarray:
+        # Dense (T, N) trajectory sampled every `stride` steps from start to stop, optionally
+        # restricted to some cells; `out` may be a preallocated (e.g. np.memmap) array to
+        # fill. A uint8 `out` receives the codes (8x smaller than float64)
+        cells = np.arange(self.size) if cells is None else np.asarray(cells)
+        stop = self.steps if stop is None else min(stop, self.steps)
+        rows = len(range(start, stop, stride))
+        if out is None:
+            out = np.empty((rows, len(cells)))
+        for row, (_, state) in enumerate(self.frame_codes(stride, start, stop)):
+            out[row] = state[cells] if out.dtype == np.uint8 else decode(state[cells])
+        return out
+
+class TrajectoryRecorder(TrajectoryView):
+    """
+    TrajectoryRecorder Class. Records the opinion trajectory of a population as
+    change events (t, cell, old, new) plus periodic keyframes (full snapshots),
+    instead of copying the whole grid every time step. Opinions are two-decimal
+    values and are stored as uint8 hundredths (see opdyn.Quantized); all queries
+    return floats.
+    01. initial: flat array of opinions before the first recorded step (t = -1)
+    02. keyframe_interval: number of steps between two keyframes
+    03. capacity: initial size of the event buffers (grown by doubling)
+    Step t refers to the state after the t-th update, as in Model.simulate.
+    """
+
+    def __init__(self, initial, keyframe_interval=1000, capacity=1024) -> None:
+        self.initial = encode(initial)
+        self.size = len(self.initial)
+        self.keyframe_interval = keyframe_interval
+        self.current = self.initial.copy()
+        self.steps = 0
+        self.count = 0
+        self.event_t = np.zeros(capacity, dtype=np.int64)
+        self.event_cell = np.zeros(capacity, dtype=np.int64)
+        self.event_old = np.zeros(capacity, dtype=np.uint8)
+        self.event_new = np.zeros(capacity, dtype=np.uint8)
+        # keyframes[i] is the state after step keyframe_t[i]; the initial state is keyframe -1
+        self.keyframe_t = [-1]
+        self.keyframes = [self.initial]
+
+    def grow(self, needed) -> None:
+        # Double the event buffers until `needed` more events fit
+        capacity = len(self.event_t)
+        while capacity < self.count + needed:
+            capacity *= 2
+        for name in ("event_t", "event_cell", "event_old", "event_new"):
+            buffer = getattr(self, name)
+            grown = np.zeros(capacity, dtype=buffer.dtype)
+            grown[:self.count] = buffer[:self.count]
+            setattr(self, name, grown)
+
+    def record(self, t, cell, old, new) -> None:
+        # Log a change of opinion of one cell during step t
+        if old == new:
+            return
+        if self.count == len(self.event_t):
+            self.grow(1)
+        i = self.count
+        self.event_t[i] = t
+        self.event_cell[i] = cell
+        self.event_old[i] = encode(old)
+        self.event_new[i] = encode(new)
+        self.count += 1
+        self.current[cell] = self.event_new[i]
+
+    def record_many(self, t, cells, old, new) -> None:
+        # Log the changes of opinion of several distinct cells during step t
+        changed = old != new
+        cells, old, new = cells[changed], old[changed], new[changed]
+        if self.count + len(cells) > len(self.event_t):
+            self.grow(len(cells))
+        span = slice(self.count, self.count + len(cells))
+        self.event_t[span] = t
+        self.event_cell[span] = cells
+        self.event_old[span] = encode(old)
+        self.event_new[span] = encode(new)
+        self.count += len(cells)
+        self.current[cells] = self.event_new[span]
+
+    def advance(self, t) -> None:
+        # Close step t; writes a keyframe every keyframe_interval steps
+        self.steps = t + 1
+        if self.steps % self.keyframe_interval == 0:
+            self.keyframe_t.append(t)
+            self.keyframes.append(self.current.copy())
+
+    def event_codes(self, start=-1, stop=None) -> tuple:
+        # events() with old / new as uint8 codes
+        stop = self.steps - 1 if stop is None else stop
+        ts = self.event_t[:self.count]
+        lo = np.searchsorted(ts, start, side="right")
+        hi = np.searchsorted(ts, stop, side="right")
+        return (ts[lo:hi], self.event_cell[lo:hi],
+                self.event_old[lo:hi], self.event_new[lo:hi])
+
+    def event_blocks(self):
+        yield self.event_codes()
+
+    def flush(self) -> None:
+        # Nothing to write: the recording is kept in memory
+        pass
+
+    def keyframe(self, k) -> np.ndarray:
+        return self.keyframes[k].copy()
+
+    def state(self) -> tuple:
+        # (meta, arrays) of the recording so far, for Checkpoint. Events and keyframes are never
+        # modified once written, so the arrays are views of them (turned into arrays by the
+        # checkpoint writer); only the current codes are copied
+        meta = {"keyframe_interval": self.keyframe_interval, "steps": self.steps,
+                "keyframe_t": list(self.keyframe_t)}
+        n = self.count
+        arrays = {"event_t": self.event_t[:n], "event_cell": self.event_cell[:n], "event_old": self.event_old[:n],
+                  "event_new": self.event_new[:n], "keyframes": list(self.keyframes), "current": self.current.copy()}
+        return meta, arrays
+
+    @classmethod
+    def restore(cls, meta, arrays):
+        # Recorder continuing from state()
+        recorder = cls.__new__(cls)
+        recorder.keyframes = list(arrays["keyframes"])
+        recorder.initial = recorder.keyframes[0]
+        recorder.size = len(recorder.initial)
+        recorder.keyframe_interval = meta["keyframe_interval"]
+        recorder.current = arrays["current"].copy()
+        recorder.steps = meta["steps"]
+        recorder.keyframe_t = list(meta["keyframe_t"])
+        recorder.count = len(arrays["event_t"])
+        capacity = max(1024, recorder.count)
+        for name in ("event_t", "event_cell", "event_old", "event_new"):
+            buffer = np.zeros(capacity, dtype=arrays[name].dtype)
+            buffer[:recorder.count] = arrays[name]
+            setattr(recorder, name, buffer)
+        return recorder
@@ -0,0 +1,188 @@
+"""
+    Headless figure rendering. Every renderer draws on its own Agg canvas (no
+    display and no pyplot state is involved) and keeps its figure and artists
+    between frames: rendering a frame only swaps the data of the existing
+    artists and writes the PNG. Renderers take opinion arrays directly (flat,
+    in cell order, e.g. Population.opinion or a row of Recorder.to_array()).
+    render_heatmaps() spreads many heatmaps over worker processes.
+"""
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from PIL import Image
+from opdyn.Categories import category_means, fuzzy_cat
+from opdyn.Clusters import category_table
+from opdyn.Quantized import codes_of
+
+# opinion category index of every opinion code
+CATEGORIES = category_table()
+
+def category_index(opinions) -> np.ndarray:
+    # Index of the closest opinion category of every opinion (as Agent.getOpCat)
+    return CATEGORIES[codes_of(np.asarray(opinions, dtype=float))]
+
+def category_values(opinions) -> np.ndarray:
+    # Crisp value of the closest opinion category of every opinion
+    return np.array(category_means("opinion"))[category_index(opinions)]
+
+class Renderer:
+    """
+    Renderer Class. A figure with one axes on an Agg canvas, reused for every
+    frame. Subclasses whose frames only differ in a few artists list them in
+    `animated`: the rest of the figure is drawn once and restored from a saved
+    background for every frame (blitting).
+    01. figsize: figure size in inches
+    02. dpi: resolution of the PNG files
+    """
+
+    def __init__(self, figsize=(6.4, 4.8), dpi=100) -> None:
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.animated = []
+        self.background = None
+
+    def draw(self) -> None:
+        # Draws the current frame on the canvas
+        if not self.animated:
+            self.canvas.draw()
+            return
+        if self.background is None:
+            # animated artists are drawn transparent (not hidden) so the layout still accounts for them
+            alphas = [artist.get_alpha() for artist in self.animated]
+            for artist in self.animated:
+                artist.set_alpha(0)
+            self.canvas.draw()
+            self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+            for artist, alpha in zip(self.animated, alphas):
+                artist.set_alpha(alpha)
+        self.canvas.restore_region(self.background)
+        for artist in self.animated:
+            self.figure.draw_artist(artist)
+
+    def pixels(self) -> np.ndarray:
+        # (H, W, 4) RGBA pixels of the current frame
+        self.draw()
+        return np.asarray(self.canvas.buffer_rgba())
+
+    def save(self, path) -> None:
+        # Writes the current frame as a PNG file
+        Image.fromarray(self.pixels()).save(path)
+
+class HeatmapRenderer(Renderer):
+    """
+    HeatmapRenderer Class. Heat map of the opinions of a grid (Helpers.plotHeatMap)
+    with a fixed [0, 1] color scale, so frames are comparable.
+    01. grid_size: number of cells on each side of the grid
+    02. categories: draw the value of every cell's opinion category instead of
+                    the opinion itself
+    03. cmap: matplotlib colormap (default: the rcParams one)
+    """
+
+    def __init__(self, grid_size, categories=False, cmap=None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.grid_size = grid_size
+        self.categories = categories
+        self.image = self.axes.imshow(np.zeros((grid_size, grid_size)), origin="lower", vmin=0, vmax=1, cmap=cmap)
+        self.axes.set_xlabel("X Coordinates")
+        self.axes.set_ylabel("Y Coordinates")
+        self.title = self.axes.set_title("")
+        self.figure.colorbar(self.image, ax=self.axes)
+        self.animated = [self.image, self.title]
+
+    def render(self, opinions, path=None, title=None):
+        # Draws one frame (and writes it to path)
+        values = category_values(opinions) if self.categories else np.asarray(opinions, dtype=float)
+        self.image.set_data(values.reshape(self.grid_size, self.grid_size))
+        if title is not None:
+            self.title.set_text(title)
+        if path is not None:
+            self.save(path)
+        return self
+
+class DistributionRenderer(Renderer):
+    """
+    DistributionRenderer Class. Bar chart of the number of agents per opinion
+    category (Helpers.plot_finalOpinions_dist).
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        names = list(fuzzy_cat["opinion"])
+        self.bars = self.axes.bar(names, np.zeros(len(names)), width=0.7)
+        self.axes.set_xticks(np.arange(len(names)), names, rotation=45, ha="right")
+        self.axes.set_xlabel("Categories")
+        self.axes.set_ylabel("Values")
+        self.title = self.axes.set_title("Bar Chart of Opinion distribution")
+        self.figure.tight_layout()
+
+    def render(self, opinions, path=None, title=None):
+        counts = np.bincount(category_index(opinions), minlength=len(self.bars))
+        for bar, count in zip(self.bars, counts):
+            bar.set_height(count)
+        self.axes.set_ylim(0, max(1, counts.max()) * 1.05)
+        if title is not None:
+            self.title.set_text(title)
+        if path is not None:
+            self.save(path)
+        return self
+
+class TrajectoryRenderer(Renderer):
+    """
+    TrajectoryRenderer Class. Opinion vs. time of every agent as one
+    LineCollection (Model.plot_opinions_over_time).
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        colors = matplotlib.rcParams["axes.prop_cycle"].by_key()["color"]
+        self.lines = LineCollection([], colors=colors, linewidths=0.8)
+        self.axes.add_collection(self.lines)
+        self.axes.set_xlabel("Time Steps")
+        self.axes.set_ylabel("Opinion")
+        self.title = self.axes.set_title("Opinion vs. Time")
+
+    def render(self, trajectory, path=None, title=None, time=None):
+        # trajectory: (T, N) opinions; time: (T,) time step of every row (default 0 ... T - 1)
+        trajectory = np.asarray(trajectory, dtype=float)
+        time = np.arange(len(trajectory)) if time is None else np.asarray(time)
+        segments = np.empty((trajectory.shape[1], len(time), 2))
+        segments[:, :, 0] = time
+        segments[:, :, 1] = trajectory.T
+        self.lines.set_segments(segments)
+        self.axes.set_xlim(time[0], max(time[-1], time[0] + 1))
+        self.axes.set_ylim(-0.05, 1.05)
+        if title is not None:
+            self.title.set_text(title)
+        if path is not None:
+            self.save(path)
+        return self
+
+@functools.lru_cache(maxsize=None)
+def heatmap_renderer(grid_size, categories=False) -> HeatmapRenderer:
+    # Heatmap renderer shared by all frames of one process
+    return HeatmapRenderer(grid_size, categories)
+
+def render_heatmap(job) -> str:
+    # Renders one (opinions, path, title, categories) job with the process' renderer
+    opinions, path, title, categories = job
+    grid_size = int(round(np.sqrt(len(opinions))))
+    heatmap_renderer(grid_size, categories).render(opinions, path, title)
+    return path
+
+def render_heatmaps(opinions, paths, titles=None, categories=False, workers=None, chunk=16) -> list:
+    # Renders heatmap r of the opinions of many runs / frames ((R, N) or a list of flat
+    # arrays) to paths[r]. workers: number of worker processes (default: all cores; 0
+    # renders in this process); every worker reuses one renderer for all its frames
+    titles = [None] * len(paths) if titles is None else titles
+    jobs = [(np.asarray(values), path, title, categories) for values, path, title in zip(opinions, paths, titles)]
+    workers = os.cpu_count() if workers is None else workers
+    if workers == 0:
+        return [render_heatmap(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(render_heatmap, jobs, chunksize=chunk))
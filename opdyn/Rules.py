@@ -0,0 +1,138 @@
+"""
+    Rule extraction: the single-cell transition of the local rule (Model.update
+    with a constant NSI coefficient) for every combination of a cell's opinion,
+    its dissenter and leader flags, the NSI coefficient and the average opinion
+    of its neighbors. All combinations are evaluated as one batch by the
+    vectorized kernel (opdyn.Kernels) and the table is written in one go.
+    CompiledRules precomputes the fuzzy NSI stage of the rule for a constant
+    NSI coefficient, as used by Model.update when the model has one.
+"""
+import functools
+import numpy as np
+from opdyn import Kernels
+from opdyn.Categories import LEVELS, category_means, fuzzy_cat, membership_table, memberships
+from opdyn.Quantized import codes_of
+
+HEADER = ["Opinion(t)", "Dissenter", "Leader", "NSI_Coeff", "Avg_Opinion", "Opinion(t+1)"]
+COLUMNS = ["opinion", "dissenter", "leader", "nsi", "avg_opinion", "next_opinion"]
+
+class RuleState:
+    """
+    Kernel state of a batch of isolated cells: cell i has the opinion, flags and
+    NSI coefficient of combination i, and its 8 Moore neighbors all hold the
+    combination's average opinion (one shared cell per average level, stored
+    after the batch). A cell starts from the fuzzified value of its own opinion.
+    01. opinion, dissenter, leader, nsi, avg_opinion: (B,) values of the combinations
+    02. confidence, tolerance: confidence threshold and tolerance of every cell
+    03. leader_weight: influence of a leader (as Population.leader_weight)
+    """
+
+    def __init__(self, opinion, dissenter, leader, nsi, avg_opinion, confidence, tolerance, leader_weight) -> None:
+        levels, slot = np.unique(avg_opinion, return_inverse=True)
+        batch, n = len(opinion), len(opinion) + len(levels)
+        self.opinion = np.concatenate([opinion, levels])
+        self.neighbors = np.repeat(np.arange(n)[:, None], 8, axis=1)
+        self.neighbors[:batch] = (batch + slot)[:, None]
+        self.degree = np.full(n, 8)
+        self.confidence = np.full(n, confidence, dtype=float)
+        self.tolerance = np.full(n, tolerance, dtype=float)
+        self.delta = np.zeros(n)
+        self.k = np.zeros(n)
+        self.dissenter = np.concatenate([dissenter, np.zeros(len(levels), dtype=bool)])
+        self.leader = np.concatenate([leader, np.zeros(len(levels), dtype=bool)])
+        self.fixed_nsi = np.concatenate([nsi, np.zeros(len(levels))])
+        self.nsi = self.fixed_nsi.copy()
+        self.fuzzy_opinion = membership_table("opinion")[codes_of(self.opinion)]
+        self.fuzzy_nsi = np.zeros((n, len(fuzzy_cat["nsi_coeff"])))
+        self.learning_rate = 0.0
+        self.leader_weight = leader_weight
+
+def levels(n=LEVELS) -> np.ndarray:
+    # n evenly spaced two-decimal values in [0, 1] (n=101: every opinion level)
+    return np.round(np.linspace(0, 1, n), 2)
+
+def rule_table(opinions=None, nsi=None, avg_opinions=None, confidence=0.3, tolerance=0.1,
+               leader_weight=0.1, chunk=1 << 16) -> dict:
+    # Next opinion for every combination of (opinion, dissenter, leader, nsi, avg_opinion),
+    # in the order of itertools.product (dissenter and leader: True first). Defaults: all
+    # 101 opinion levels for opinions and average opinions, the 5 category values for nsi.
+    # Returns a dict of flat columns (see COLUMNS)
+    opinions = levels() if opinions is None else np.asarray(opinions, dtype=float)
+    nsi = np.array(category_means("nsi_coeff")) if nsi is None else np.asarray(nsi, dtype=float)
+    avg_opinions = levels() if avg_opinions is None else np.asarray(avg_opinions, dtype=float)
+    flags = np.array([True, False])
+    grids = np.meshgrid(opinions, flags, flags, nsi, avg_opinions, indexing="ij")
+    table = dict(zip(COLUMNS, [grid.ravel() for grid in grids]))
+    table["next_opinion"] = np.empty(len(table["opinion"]))
+    for start in range(0, len(table["opinion"]), chunk):
+        part = slice(start, start + chunk)
+        state = RuleState(table["opinion"][part], table["dissenter"][part], table["leader"][part],
+                          table["nsi"][part], table["avg_opinion"][part], confidence, tolerance, leader_weight)
+        cells = np.arange(len(table["opinion"][part]))
+        table["next_opinion"][part] = Kernels.evaluate(state, cells)["opinion"]
+    return table
+
+def categories(param, values) -> np.ndarray:
+    # Name of the closest category of every value (ties go to the lower category, as Agent.getOpCat)
+    means = np.array(category_means(param))
+    return np.array(list(fuzzy_cat[param]))[np.abs(np.asarray(values)[:, None] - means).argmin(axis=1)]
+
+def write_csv(table, path, labels=True) -> None:
+    # Writes a rule table as CSV with a single write; labels=True writes category names
+    # (as samples2.csv), labels=False the values themselves
+    columns = [table[name] for name in COLUMNS]
+    if labels:
+        params = ["opinion", None, None, "nsi_coeff", "avg_opinion", "opinion"]
+        columns = [column if param is None else categories(param, column) for param, column in zip(params, columns)]
+    columns = [np.asarray(column).astype(str) for column in columns]
+    rows = [",".join(row) for row in zip(*columns)]
+    with open(path, "w", encoding="UTF8", newline="") as file:
+        file.write("\n".join([",".join(HEADER)] + rows) + "\n")
+
+def save(table, path) -> None:
+    # Writes a rule table as a binary .npz file (one array per column)
+    np.savez(path, **table)
+
+def load(path) -> dict:
+    with np.load(path) as data:
+        return {name: data[name] for name in COLUMNS}
+
+class CompiledRules:
+    """
+    CompiledRules Class. The fuzzy NSI stage of Model.update (leader, dissenter
+    and conformist cases, with roundToRange after every term) for a constant
+    NSI coefficient. With the coefficient fixed, its fuzzy memberships are
+    computed once per (leader_weight, nsi, sigma) and the stage reduces to the
+    same fixed chain of clipped terms for every opinion category: apply() runs
+    that chain on all categories at once, with the same arithmetic (and
+    results) as the exact per-category loops.
+    01. leader_weight: influence of a leader (Population.leader_weight)
+    02. nsi: constant NSI coefficient (Model(nsi=...))
+    03. sigma: width of the NSI membership functions
+    """
+
+    def __init__(self, leader_weight, nsi, sigma=0.1) -> None:
+        self.leader_weight = leader_weight
+        self.nsi = nsi
+        self.sigma = sigma
+        self.build()
+        self.terms = self.fuzzy_nsi.tolist()
+
+    def build(self) -> None:
+        # Fuzzy memberships of the NSI coefficient (the terms of every case)
+        self.fuzzy_nsi = np.array(memberships("nsi_coeff", self.nsi, self.sigma))
+
+    def apply(self, degrees, leader, dissenter) -> np.ndarray:
+        # Degrees of membership of a fuzzy opinion after the NSI stage
+        w = self.leader_weight
+        if leader:
+            for g in self.terms:
+                degrees = Kernels.clip((degrees * (1 - w) + degrees * w) + g)
+        for g in self.terms:
+            degrees = Kernels.clip(degrees - g if dissenter else degrees + g)
+        return degrees
+
+@functools.lru_cache(maxsize=None)
+def compiled(leader_weight, nsi, sigma=0.1) -> CompiledRules:
+    # Compiled rules of one parameter set, shared within the process
+    return CompiledRules(leader_weight, nsi, sigma)
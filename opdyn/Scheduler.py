@@ -0,0 +1,102 @@
+import random
+import numpy as np
+
+class CellSelector:
+    """
+    CellSelector Class. Generates the order in which cells are picked by the
+    fully asynchronous update. Picks are drawn ahead of time in chunks from a
+    vectorized NumPy generator, so selecting a cell is O(1) per step.
+    01. size: number of cells in the population
+    02. mode: "uniform" - every step picks a cell uniformly at random (with replacement)
+              "sweep"   - every block of `size` steps visits each cell exactly once,
+                          in a fresh random permutation
+    03. chunk: number of picks drawn at once in "uniform" mode
+    04. rng: numpy.random.Generator; by default seeded from the `random` module
+             so that `random.seed(...)` keeps runs reproducible
+    """
+
+    modes = ("uniform", "sweep")
+
+    def __init__(self, size, mode="uniform", chunk=4096, rng=None) -> None:
+        if mode not in self.modes:
+            raise ValueError("mode must be one of " + ", ".join(self.modes))
+        self.size = size
+        self.mode = mode
+        self.chunk = chunk
+        self.rng = rng if rng is not None else np.random.default_rng(random.getrandbits(64))
+        # pre-sized index array, shuffled in place for every sweep
+        self.order = np.arange(size)
+        self.buffer = []
+        self.pos = 0
+
+    def refill(self) -> None:
+        # Draw the next block of picks
+        if self.mode == "sweep":
+            self.rng.shuffle(self.order)
+            self.buffer = self.order.tolist()
+        else:
+            self.buffer = self.rng.integers(0, self.size, self.chunk).tolist()
+        self.pos = 0
+
+    def next(self) -> int:
+        # Flat id of the next cell to update
+        if self.pos == len(self.buffer):
+            self.refill()
+        cell = self.buffer[self.pos]
+        self.pos += 1
+        return cell
+
+    def unread(self, picks) -> None:
+        # Put picks obtained from take() back; they are handed out again first
+        self.buffer = np.asarray(picks).tolist() + self.buffer[self.pos:]
+        self.pos = 0
+
+    def take(self, n) -> np.ndarray:
+        # Flat ids of the next n cells to update, in order
+        picks = np.empty(n, dtype=np.int64)
+        filled = 0
+        while filled < n:
+            if self.pos == len(self.buffer):
+                self.refill()
+            count = min(n - filled, len(self.buffer) - self.pos)
+            picks[filled:filled + count] = self.buffer[self.pos:self.pos + count]
+            self.pos += count
+            filled += count
+        return picks
+
+def independent_groups(picks, neighbors) -> list:
+    """
+    Splits a sequence of picks into consecutive groups whose updates commute.
+    An update reads and writes only the picked cell and its neighbors, so picks
+    whose closed neighborhoods are pairwise disjoint can be applied at once
+    with the same result as applying them one after another. Groups are
+    formed greedily: a group ends right before the first pick that shares a
+    cell with a pick already in the group.
+    01. picks: flat ids of the cells to update, in order
+    02. neighbors: (N, D) neighbor table (see Population.neighborTable); rows
+                   may be padded with the cell's own id
+    Returns a list of arrays (views of picks) covering picks in order.
+    """
+    picks = np.asarray(picks)
+    n = len(picks)
+    if n == 0:
+        return []
+    # (pick, cell) pairs of every closed neighborhood, without duplicates
+    members = np.column_stack([picks, neighbors[picks]])
+    width = int(members.max()) + 1
+    keys = np.unique(np.repeat(np.arange(n), members.shape[1]) * width + members.ravel())
+    pick, cell = np.divmod(keys, width)
+    # previous pick touching the same cell, for every pair
+    order = np.lexsort((pick, cell))
+    pick, cell = pick[order], cell[order]
+    previous = np.full(len(pick), -1)
+    previous[1:] = np.where(cell[1:] == cell[:-1], pick[:-1], -1)
+    # index of the last earlier pick each pick conflicts with
+    last = np.full(n, -1)
+    np.maximum.at(last, pick, previous)
+    starts = [0]
+    for i, conflict in enumerate(last.tolist()):
+        if conflict >= starts[-1]:
+            starts.append(i)
+    starts.append(n)
+    return [picks[a:b] for a, b in zip(starts[:-1], starts[1:])]
@@ -0,0 +1,98 @@
+import numpy as np
+from opdyn.Categories import LEVELS
+from opdyn.Quantized import codes_of, encode, level
+
+class OpinionStats:
+    """
+    OpinionStats Class. Live summary of the opinions of a population, kept up
+    to date from the cells that change instead of being recomputed from the
+    whole grid. Holds a 101-bin histogram of opinions (in hundredths), the
+    running sum and sum of squares of the opinions, the sum of squared cluster
+    sizes (clusters: agents sharing one opinion, as in Helpers.metrics) and
+    the history of the HHI.
+    All sums are kept as integers in hundredths, so they never drift.
+    """
+
+    def start(self, popl, t) -> None:
+        # Build the statistics from the population's opinions before step t
+        codes = codes_of(popl.opinion)
+        self.size = popl.size
+        self.counts = np.bincount(codes, minlength=LEVELS)
+        self.total = int(codes.sum())
+        self.squares = int((codes ** 2).sum())
+        # sum of squared sizes of the clusters with more than one member
+        self.cluster_squares = int((self.counts[self.counts > 1] ** 2).sum())
+        # HHI after every step at which it changed (t = start - 1: initial state)
+        self.history_t = [t - 1]
+        self.history_hhi = [self.hhi()]
+        # last step the statistics were notified of (changed or not)
+        self.last_t = t - 1
+
+    def resize(self, bin, change) -> None:
+        # Moves one agent into (change=1) or out of (change=-1) an opinion bin
+        before = self.counts[bin]
+        after = before + change
+        self.cluster_squares += (after ** 2 if after > 1 else 0) - (before ** 2 if before > 1 else 0)
+        self.counts[bin] = after
+        self.total += change * bin
+        self.squares += change * bin * bin
+
+    def log(self, t) -> None:
+        # Append the HHI after step t to the history if it changed
+        hhi = self.hhi()
+        if hhi != self.history_hhi[-1]:
+            self.history_t.append(t)
+            self.history_hhi.append(hhi)
+
+    def update(self, t, cell, old, new) -> None:
+        # Opinion of `cell` changed from old to new during step t
+        self.last_t = t
+        if old != new:
+            self.resize(level(old), -1)
+            self.resize(level(new), 1)
+            self.log(t)
+
+    def update_many(self, t, cells, old, new) -> None:
+        # Opinions of several distinct cells changed during step t
+        self.last_t = t
+        changed = old != new
+        old, new = encode(old[changed]).astype(np.int64), encode(new[changed]).astype(np.int64)
+        np.subtract.at(self.counts, old, 1)
+        np.add.at(self.counts, new, 1)
+        self.total += int(new.sum() - old.sum())
+        self.squares += int((new ** 2).sum() - (old ** 2).sum())
+        self.cluster_squares = int((self.counts[self.counts > 1] ** 2).sum())
+        self.log(t)
+
+    def hhi(self) -> float:
+        # Herfindahl-Hirschman index of the opinion clusters
+        return self.cluster_squares / self.size ** 2
+
+    def mean(self) -> float:
+        return self.total / (100 * self.size)
+
+    def std(self) -> float:
+        # Population standard deviation (as np.std)
+        variance = (self.squares - self.total ** 2 / self.size) / self.size
+        return float(np.sqrt(max(variance, 0.0))) / 100
+
+    def median(self) -> float:
+        # Median opinion, read from the cumulative histogram
+        cumulative = np.cumsum(self.counts)
+        low = int(np.searchsorted(cumulative, (self.size - 1) // 2, side="right"))
+        high = int(np.searchsorted(cumulative, self.size // 2, side="right"))
+        return (low + high) / 200
+
+    def hhi_series(self, stop=None) -> np.ndarray:
+        # HHI after every step t from the start of the statistics up to (excluding) stop
+        # (default: up to the last step the statistics were notified of)
+        stop = self.last_t + 1 if stop is None else stop
+        t = np.arange(self.history_t[0] + 1, stop)
+        return np.asarray(self.history_hhi)[np.searchsorted(self.history_t, t, side="right") - 1]
+
+    def summary(self) -> dict:
+        # HHI (rounded as Helpers.metrics), mean, standard deviation and median
+        return {"hhi": float(np.round(self.hhi(), 3)),
+                "mean": self.mean(),
+                "std": self.std(),
+                "median": self.median()}
@@ -0,0 +1,254 @@
+import glob
+import json
+import os
+import numpy as np
+from opdyn.Quantized import encode
+from opdyn.Recorder import TrajectoryView
+
+def clear(path) -> None:
+    # Remove the files of a store from its directory
+    names = ["manifest.json", "manifest.json.tmp", "keyframes.u8"]
+    names += glob.glob("events_*.npz", root_dir=path)
+    for name in names:
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
+
+class TrajectoryStore(TrajectoryView):
+    """
+    TrajectoryStore Class. Writes an opinion trajectory to a directory on disk
+    while it is recorded, so the history of a run is not limited by RAM, and
+    answers the same queries as TrajectoryRecorder by reading only the parts
+    it needs. Layout of the directory:
+      manifest.json      size, keyframe interval, steps, keyframe steps, chunk index
+      keyframes.u8       uint8 opinion codes, one row of `size` bytes per keyframe
+                         (row 0: initial state), read through a memory map
+      events_NNNNNN.npz  compressed chunks of change events (t, cell, old, new)
+    01. path: directory of the store (created if needed)
+    02. initial: flat array of opinions before the first recorded step
+    03. keyframe_interval: number of steps between two keyframes
+    04. chunk: number of events per event chunk
+    05. overwrite: replace the store already in `path`; by default a non-empty
+                   directory is refused
+    Use TrajectoryStore.open(path) to read an existing store. A pickled store
+    (e.g. in a Model stored by Cache.ResultCache) only holds its path and is
+    unpickled as TrajectoryStore.open(path).
+    """
+
+    def __init__(self, path, initial, keyframe_interval=1000, chunk=1 << 16, overwrite=False) -> None:
+        os.makedirs(path, exist_ok=True)
+        if os.listdir(path):
+            if not overwrite:
+                raise FileExistsError("store directory " + path + " is not empty (pass overwrite=True to replace it)")
+            clear(path)
+        self.path = path
+        self.initial = encode(initial)
+        self.size = len(self.initial)
+        self.keyframe_interval = keyframe_interval
+        self.chunk = chunk
+        self.current = self.initial.copy()
+        self.steps = 0
+        self.keyframe_t = [-1]
+        # chunk index: (file name, first step, last step, number of events)
+        self.chunks = []
+        self.count = 0
+        self.event_t = np.zeros(chunk, dtype=np.int64)
+        self.event_cell = np.zeros(chunk, dtype=np.int64)
+        self.event_old = np.zeros(chunk, dtype=np.uint8)
+        self.event_new = np.zeros(chunk, dtype=np.uint8)
+        self.writable = True
+        self.keyframe_file = open(os.path.join(path, "keyframes.u8"), "wb")
+        self.keyframe_file.write(self.initial.tobytes())
+        self.keyframe_file.flush()
+        self.keyframe_map = None
+        self.cache = {}
+        self.write_manifest()
+
+    @classmethod
+    def open(cls, path):
+        # Read-only store of a finished (or checkpointed) recording
+        with open(os.path.join(path, "manifest.json")) as file:
+            manifest = json.load(file)
+        store = cls.__new__(cls)
+        store.path = path
+        store.size = manifest["size"]
+        store.keyframe_interval = manifest["keyframe_interval"]
+        store.chunk = manifest["chunk"]
+        store.steps = manifest["steps"]
+        store.keyframe_t = manifest["keyframe_t"]
+        store.chunks = [tuple(entry) for entry in manifest["chunks"]]
+        store.count = 0
+        store.event_t = np.zeros(0, dtype=np.int64)
+        store.event_cell = np.zeros(0, dtype=np.int64)
+        store.event_old = np.zeros(0, dtype=np.uint8)
+        store.event_new = np.zeros(0, dtype=np.uint8)
+        store.writable = False
+        store.keyframe_file = None
+        store.keyframe_map = None
+        store.cache = {}
+        store.initial = store.keyframe(0)
+        return store
+
+    def __getstate__(self) -> dict:
+        if self.writable:
+            self.flush()
+        return {"path": self.path}
+
+    def __setstate__(self, state) -> None:
+        self.__dict__.update(vars(TrajectoryStore.open(state["path"])))
+
+    def state(self) -> tuple:
+        # (manifest, arrays) of the store so far, for Checkpoint: the event chunks and keyframes
+        # already on disk plus copies of the buffered events (at most one chunk) and current codes
+        self.keyframe_file.flush()
+        manifest = {"path": self.path, "size": self.size, "keyframe_interval": self.keyframe_interval,
+                    "chunk": self.chunk, "steps": self.steps, "keyframe_t": list(self.keyframe_t),
+                    "chunks": list(self.chunks)}
+        n = self.count
+        arrays = {"event_t": self.event_t[:n].copy(), "event_cell": self.event_cell[:n].copy(),
+                  "event_old": self.event_old[:n].copy(), "event_new": self.event_new[:n].copy(),
+                  "current": self.current.copy()}
+        return manifest, arrays
+
+    @classmethod
+    def resume(cls, manifest, arrays):
+        # Writable store continuing from state(): keyframes and event chunks written after it
+        # (by the interrupted run) are discarded
+        store = cls.__new__(cls)
+        store.path = manifest["path"]
+        store.size = manifest["size"]
+        store.keyframe_interval = manifest["keyframe_interval"]
+        store.chunk = manifest["chunk"]
+        store.steps = manifest["steps"]
+        store.keyframe_t = list(manifest["keyframe_t"])
+        store.chunks = [tuple(entry) for entry in manifest["chunks"]]
+        kept = {entry[0] for entry in store.chunks}
+        for name in glob.glob("events_*.npz", root_dir=store.path):
+            if name not in kept:
+                os.remove(os.path.join(store.path, name))
+        store.count = len(arrays["event_t"])
+        for name in ("event_t", "event_cell", "event_old", "event_new"):
+            buffer = np.zeros(store.chunk, dtype=arrays[name].dtype)
+            buffer[:store.count] = arrays[name]
+            setattr(store, name, buffer)
+        store.current = arrays["current"].copy()
+        store.writable = True
+        store.keyframe_file = open(os.path.join(store.path, "keyframes.u8"), "r+b")
+        store.keyframe_file.truncate(len(store.keyframe_t) * store.size)
+        store.keyframe_file.seek(0, os.SEEK_END)
+        store.keyframe_map = None
+        store.cache = {}
+        store.initial = store.keyframe(0)
+        store.write_manifest()
+        return store
+
+    def write_manifest(self) -> None:
+        # Replace the manifest atomically (a reader never sees a half-written one)
+        manifest = {"size": self.size, "keyframe_interval": self.keyframe_interval, "chunk": self.chunk,
+                    "steps": self.steps, "keyframe_t": self.keyframe_t, "chunks": self.chunks}
+        temporary = os.path.join(self.path, "manifest.json.tmp")
+        with open(temporary, "w") as file:
+            json.dump(manifest, file)
+        os.replace(temporary, os.path.join(self.path, "manifest.json"))
+
+    def record(self, t, cell, old, new) -> None:
+        # Log a change of opinion of one cell during step t
+        if old == new:
+            return
+        i = self.count
+        self.event_t[i] = t
+        self.event_cell[i] = cell
+        self.event_old[i] = encode(old)
+        self.event_new[i] = encode(new)
+        self.count += 1
+        self.current[cell] = self.event_new[i]
+        if self.count == self.chunk:
+            self.write_chunk()
+
+    def record_many(self, t, cells, old, new) -> None:
+        # Log the changes of opinion of several distinct cells during step t
+        changed = old != new
+        cells, old, new = cells[changed], encode(old[changed]), encode(new[changed])
+        pos = 0
+        while pos < len(cells):
+            n = min(self.chunk - self.count, len(cells) - pos)
+            span, source = slice(self.count, self.count + n), slice(pos, pos + n)
+            self.event_t[span] = t
+            self.event_cell[span] = cells[source]
+            self.event_old[span] = old[source]
+            self.event_new[span] = new[source]
+            self.count += n
+            pos += n
+            if self.count == self.chunk:
+                self.write_chunk()
+        self.current[cells] = new
+
+    def advance(self, t) -> None:
+        # Close step t; appends a keyframe every keyframe_interval steps
+        self.steps = t + 1
+        if self.steps % self.keyframe_interval == 0:
+            self.keyframe_t.append(t)
+            self.keyframe_file.write(self.current.tobytes())
+
+    def write_chunk(self) -> None:
+        # Move the buffered events into a new compressed chunk file
+        if self.count == 0:
+            return
+        name = "events_%06d.npz" % len(self.chunks)
+        n = self.count
+        np.savez_compressed(os.path.join(self.path, name), t=self.event_t[:n], cell=self.event_cell[:n],
+                            old=self.event_old[:n], new=self.event_new[:n])
+        self.chunks.append((name, int(self.event_t[0]), int(self.event_t[n - 1]), n))
+        self.count = 0
+        self.write_manifest()
+
+    def flush(self) -> None:
+        # Make everything recorded so far readable from disk
+        self.write_chunk()
+        self.keyframe_file.flush()
+        self.write_manifest()
+
+    def close(self) -> None:
+        if self.writable:
+            self.flush()
+            self.keyframe_file.close()
+            self.writable = False
+
+    def chunk_codes(self, i) -> tuple:
+        # (t, cell, old, new) of event chunk i; the last chunks read are kept in memory
+        if i not in self.cache:
+            with np.load(os.path.join(self.path, self.chunks[i][0])) as data:
+                arrays = (data["t"], data["cell"], data["old"], data["new"])
+            if len(self.cache) >= 4:
+                self.cache.pop(next(iter(self.cache)))
+            self.cache[i] = arrays
+        return self.cache[i]
+
+    def event_blocks(self):
+        for i in range(len(self.chunks)):
+            yield self.chunk_codes(i)
+        n = self.count
+        yield self.event_t[:n], self.event_cell[:n], self.event_old[:n], self.event_new[:n]
+
+    def event_codes(self, start=-1, stop=None) -> tuple:
+        # Events with start < t <= stop, reading only the chunks that overlap the window
+        stop = self.steps - 1 if stop is None else stop
+        blocks = [self.chunk_codes(i) for i, (_, first, last, _) in enumerate(self.chunks)
+                  if last > start and first <= stop]
+        n = self.count
+        blocks.append((self.event_t[:n], self.event_cell[:n], self.event_old[:n], self.event_new[:n]))
+        parts = []
+        for block in blocks:
+            lo = np.searchsorted(block[0], start, side="right")
+            hi = np.searchsorted(block[0], stop, side="right")
+            parts.append([column[lo:hi] for column in block])
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def keyframe(self, k) -> np.ndarray:
+        # Codes of keyframe k, read through a memory map of keyframes.u8
+        rows = len(self.keyframe_t)
+        if self.keyframe_map is None or len(self.keyframe_map) < rows:
+            if self.writable:
+                self.keyframe_file.flush()
+            self.keyframe_map = np.memmap(os.path.join(self.path, "keyframes.u8"), dtype=np.uint8,
+                                          mode="r", shape=(rows, self.size))
+        return np.array(self.keyframe_map[k])
@@ -0,0 +1,98 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from opdyn.Model import Model
+
+def job_rng(seed, index) -> np.random.Generator:
+    # Generator of job `index` of a sweep seeded with `seed`: child `index` of
+    # SeedSequence(seed).spawn(...), independent of the other jobs' streams
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(index,)))
+
+def job_row(job, summary) -> dict:
+    # Row of the result table of a job
+    index, params, config, seed = job
+    row = {"job": index, "seed": seed}
+    row.update(params)
+    row.update(summary)
+    return row
+
+def run_job(job) -> tuple:
+    # Runs one Model configuration; returns its row of the result table and the model
+    index, params, config, seed = job
+    model = Model(**config, rng=job_rng(seed, index))
+    model.simulate()
+    return job_row(job, model.stats.summary()), model
+
+class Sweep:
+    """
+    Sweep Class. Runs one Model per point of a parameter grid and fans the
+    jobs out across a pool of worker processes.
+    01. grid: dict of Model keyword argument -> list of values; every combination
+              (cartesian product, in the order given) is one job
+    02. base: dict of Model keyword arguments shared by all jobs
+    03. seed: base seed; every job draws from its own stream spawned from
+              SeedSequence(seed) (see job_rng), so results do not depend on which
+              worker ran the job or when, and match a serial run
+    04. workers: number of worker processes (default: all cores; 0 runs serially)
+    05. cache: Cache.ResultCache or None; jobs found in it are not run again (their
+               rows are read from the cache) and new results are added to it
+    Each result row holds the job index, the base seed, its parameters and the HHI,
+    mean, standard deviation and median of the final opinions.
+    """
+
+    def __init__(self, grid, base, seed=1234, workers=None, cache=None) -> None:
+        self.grid = dict(grid)
+        self.base = dict(base, record=False)
+        self.seed = seed
+        self.workers = os.cpu_count() if workers is None else workers
+        self.cache = cache
+        self.rows = []
+
+    def jobs(self) -> list:
+        # (index, params, Model config, seed) of every point of the grid
+        names = list(self.grid)
+        jobs = []
+        for index, values in enumerate(itertools.product(*self.grid.values())):
+            params = dict(zip(names, values))
+            jobs.append((index, params, dict(self.base, **params), self.seed))
+        return jobs
+
+    def key(self, job) -> str:
+        # Cache key of a job (the same as cache.simulate(config, seed, stream=index))
+        index, params, config, seed = job
+        return self.cache.key(config, seed, index)
+
+    def run(self):
+        # Yields result rows as the jobs finish (in completion order); cached jobs first
+        self.rows = []
+        jobs = []
+        for job in self.jobs():
+            summary = None if self.cache is None else self.cache.summary(self.key(job))
+            if summary is None:
+                jobs.append(job)
+            else:
+                self.rows.append(job_row(job, summary))
+                yield self.rows[-1]
+        if self.workers == 0:
+            for job in jobs:
+                yield self.finish(job, *run_job(job))
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(run_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                yield self.finish(futures[future], *future.result())
+
+    def finish(self, job, row, model) -> dict:
+        # Keeps the row of a job that has run (and its model, in the cache)
+        if self.cache is not None:
+            self.cache.put(self.key(job), model)
+        self.rows.append(row)
+        return row
+
+    def table(self) -> list:
+        # Runs the whole sweep (if not done yet) and returns the rows in job order
+        if not self.rows:
+            for _ in self.run():
+                pass
+        return sorted(self.rows, key=lambda row: row["job"])